@@ -54,7 +54,15 @@ format_file() {
                 /home/j.boom/develop/genomescan/src/python/check-family-variants.py \
                 /home/j.boom/develop/genomescan/src/python/calculate-final-rank.py \
                 /home/j.boom/develop/genomescan/src/python/benchmark.py \
-                /home/j.boom/develop/genomescan/src/python/analyse-exomiser-files.py
+                /home/j.boom/develop/genomescan/src/python/analyse-exomiser-files.py \
+                /home/j.boom/develop/genomescan/src/python/phen2gene_table.py \
+                /home/j.boom/develop/genomescan/src/python/vcf_annotation.py \
+                /home/j.boom/develop/genomescan/src/python/feature_cache.py \
+                /home/j.boom/develop/genomescan/src/python/score_normalisation.py \
+                /home/j.boom/develop/genomescan/src/python/stage_cache.py \
+                /home/j.boom/develop/genomescan/src/python/filter_expression.py \
+                /home/j.boom/develop/genomescan/src/python/slurm_jobs.py \
+                /home/j.boom/develop/genomescan/src/python/fake-slurm.py
 }
 
 main() {
@@ -22,10 +22,25 @@
 
 # Imports:
 import argparse
+import hashlib
+import joblib
+import json
+import numpy as np
+import os
 import pandas as pd
-import re
+import time
 from cyvcf2 import VCF
+from feature_cache import file_digest
+from joblib import Parallel, delayed
+from phen2gene_table import Phen2GeneTable
+from score_normalisation import ScoreNormaliser
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.inspection import permutation_importance
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+from stage_cache import StageCache
+from vcf_annotation import AnnotationParser
 
 
 class TSV:
@@ -37,15 +52,22 @@ class TSV:
         feature weights.
 
         This function creates a number of class attributes:
-            vep_annotation = a list of strings with the names of each section
-                             of annotation that VEP could add to a variant.
-            exomiser_annotation = a list of strings with the names of each
-                                  annotation field that exomiser adds to a
-                                  variant.
-            dtype_options_vep = a dictionary with dtype definitions for all
-                                columns in the vep tsv.
-            dtype_options_exomiser = a dictionary with dtype definitions for
-                                     all columns in the exomiser tsv.
+            chunk_size = the number of variants of which the VEP scores are
+                         extracted as one batch.
+            vep_scores = a list of strings with the names of the VEP scores.
+            normalised_features = a list of strings with the names of the
+                                  normalised feature columns, in the order of
+                                  the features in rank-variants.py.
+            search_block_size = the maximum number of scores (variants times
+                                weight vectors) that are ranked at once during
+                                the weight search.
+            stages = a list of strings with the names of the stages that are
+                     skipped if their inputs did not change.
+            parameter_grid = a dictionary with the random forest
+                             hyperparameters that are evaluated with
+                             cross-validation.
+            epochs = the number of passes over the scaled scores of the
+                     incremental classifier.
             dtype_options_combined = a dictionary with dtype definitions for
                                      all columns in the combined tsv.
             dtype_options_combined_clean_normalised = a dictionary with dtype
@@ -54,84 +76,38 @@ class TSV:
                                                       tsv.
     """
 
-    vep_annotation = [
-        "Allele",
-        "Consequence",
-        "IMPACT",
-        "SYMBOL",
-        "Gene",
-        "Feature_type",
-        "Feature",
-        "BIOTYPE",
-        "EXON",
-        "INTRON",
-        "HGVSc",
-        "HGVSp",
-        "cDNA_position",
-        "CDS_position",
-        "Protein_position",
-        "Amino_acids",
-        "Codons",
-        "Existing_variation",
-        "DISTANCE",
-        "STRAND",
-        "FLAGS",
-        "SYMBOL_SOURCE",
-        "HGNC_ID",
+    chunk_size = 50000
+    vep_scores = [
         "CADD_PHRED",
         "CADD_RAW",
         "CAPICE_SCORE",
         "FATHMM_MKL_C",
         "FATHMM_MKL_NC",
     ]
-    exomiser_annotation = [
-        "RANK",
-        "ID",
-        "GENE_SYMBOL",
-        "ENTREZ_GENE_ID",
-        "MOI",
-        "P-VALUE",
+    normalised_features = [
+        "CADD_PHRED_NORMALISED",
+        "CADD_RAW_NORMALISED",
+        "CAPICE_SCORE",
+        "FATHMM_MKL_C_NORMALISED",
+        "FATHMM_MKL_NC_NORMALISED",
         "EXOMISER_GENE_COMBINED_SCORE",
-        "EXOMISER_GENE_PHENO_SCORE",
-        "EXOMISER_GENE_VARIANT_SCORE",
-        "EXOMISER_VARIANT_SCORE",
-        "CONTRIBUTING_VARIANT",
-        "WHITELIST_VARIANT",
-        "FUNCTIONAL_CLASS",
-        "HGVS",
-        "EXOMISER_ACMG_CLASSIFICATION",
-        "EXOMISER_ACMG_EVIDENCE",
-        "EXOMISER_ACMG_DISEASE_ID",
-        "EXOMISER_ACMG_DISEASE_NAME",
+        "PHEN2GENE_RANK_NORMALISED",
     ]
-    dtype_options_vep = {
-        "CHROM": "str",
-        "POS": "int",
-        "REF": "str",
-        "ALT": "str",
-        "CLASS": "str",
-        "CADD_PHRED": "float",
-        "CADD_RAW": "float",
-        "CAPICE_SCORE": "float",
-        "FATHMM_MKL_C": "float",
-        "FATHMM_MKL_NC": "float",
-        "EXOMISER_GENE_COMBINED_SCORE": "float",
-    }
-    dtype_options_exomiser = {
-        "CHROM": "str",
-        "POS": "int",
-        "REF": "str",
-        "ALT": "str",
-        "CLASS": "str",
-        "EXOMISER_GENE_COMBINED_SCORE": "float",
-        "PHEN2GENE_RANK": "int",
+    search_block_size = 20000000
+    stages = ["combined", "normalised"]
+    parameter_grid = {
+        "n_estimators": [100, 300],
+        "max_depth": [None, 10],
+        "min_samples_leaf": [1, 5],
     }
+    epochs = 5
     dtype_options_combined = {
         "CHROM": "str",
         "POS": "int",
         "REF": "str",
         "ALT": "str",
         "CLASS": "str",
+        "SAMPLE": "str",
         "CADD_PHRED": "float",
         "CADD_RAW": "float",
         "CAPICE_SCORE": "float",
@@ -146,6 +122,7 @@ class TSV:
         "REF": "str",
         "ALT": "str",
         "CLASS": "str",
+        "SAMPLE": "str",
         "CADD_PHRED": "float",
         "CADD_RAW": "float",
         "CAPICE_SCORE": "float",
@@ -160,181 +137,208 @@ class TSV:
         "PHEN2GENE_RANK_NORMALISED": "float",
     }
 
-    def __init__(self, vep_file, exomiser_file, output_name):
+    def __init__(
+        self,
+        vep_file,
+        exomiser_file,
+        output_name,
+        chunk_size=None,
+        sample=None,
+    ):
         """
         The initializer function:
             This function creates an instance attribute:
                 vep = the input vep annotated vcf file.
                 exomiser = the input exomiser annotated vcf file.
                 output = a string to use as the output name of the tsv files.
+                chunk_size = the number of variants that are read as one
+                             chunk, by default the class attribute.
+                sample = the sample name of variants without a Sample INFO
+                         field, by default the first sample of the vep vcf
+                         header or the name of the vep vcf file.
         """
         self.vep = vep_file
         self.exomiser = exomiser_file
         self.output = output_name
+        self.sample = sample
+        if chunk_size:
+            self.chunk_size = chunk_size
 
-    def create_vep_tsv(self):
+    def vep_records(self, transcripts):
         """
-        The create_vep_tsv function:
-            This function takes the vep annotated vcf file and extracts the
-            annotation, writes the relevant information to a tsv file.
+        The vep_records function:
+            This function reads the vep annotated vcf file in chunks of
+            chunk_size variants and extracts the VEP scores of each chunk as
+            one matrix, combining the CSQ entries of a variant as set by the
+            transcripts argument. For every variant a list with the position,
+            class, sample and the five scores as strings is yielded, missing
+            scores are empty strings. The sample is read from the Sample INFO
+            field, so a training set of several samples is ranked per sample.
         """
         vep_object = VCF(self.vep)
-        with open(self.output + "-vep.tsv", "w") as file_out:
-            file_out.write(
-                "CHROM\tPOS\tREF\tALT\tCLASS\tCADD_PHRED\tCADD_RAW\tCAPICE_SCORE\tFATHMM_MKL_C\tFATHMM_MKL_NC\n"
+        sample = self.sample
+        if not sample:
+            sample = (
+                vep_object.samples[0]
+                if vep_object.samples
+                else os.path.basename(self.vep).split(".")[0]
             )
-            for variant in vep_object:
-                chrom = variant.CHROM
-                pos = variant.POS
-                ref = variant.REF
-                alt = variant.ALT[0] if variant.ALT else ""
-                class_info = variant.INFO.get("Class", "")
-                csq_info = variant.INFO.get("CSQ", "")
-                csq_annotation = csq_info.split(",")[0].split("|")
-                csq_annotation_dict = dict(
-                    zip(self.vep_annotation, csq_annotation)
-                )
-                keys = [
-                    "CADD_PHRED",
-                    "CADD_RAW",
-                    "CAPICE_SCORE",
-                    "FATHMM_MKL_C",
-                    "FATHMM_MKL_NC",
+        csq_extractor = AnnotationParser(vep_object).csq_matrix_extractor(
+            self.vep_scores, transcripts
+        )
+        records = []
+        csq_infos = []
+        for variant in vep_object:
+            records.append(
+                [
+                    variant.CHROM,
+                    variant.POS,
+                    variant.REF,
+                    variant.ALT[0] if variant.ALT else "",
+                    variant.INFO.get("Class", ""),
+                    variant.INFO.get("Sample", sample),
                 ]
-                values = [csq_annotation_dict.get(key, "") for key in keys]
-                file_out.write(
-                    f"{chrom}\t{pos}\t{ref}\t{alt}\t{class_info}\t"
-                    + "\t".join(values)
-                    + "\n"
-                )
+            )
+            csq_infos.append(variant.INFO.get("CSQ", ""))
+            if len(records) == self.chunk_size:
+                yield from self.add_scores(records, csq_extractor(csq_infos))
+                records = []
+                csq_infos = []
+        if records:
+            yield from self.add_scores(records, csq_extractor(csq_infos))
 
-    def parse_exomiser_info(self, info_field):
+    def add_scores(self, records, scores):
         """
-        The parse_exomiser_info function:
-            This function selects a string in between two brackets. It selects
-            the first element/group and splits on a pipe character. The list is
-            returned.
+        The add_scores function:
+            This function adds the scores of a score matrix to the matching
+            records as strings, NaN values become empty strings. The records
+            are returned.
         """
-        match = re.match(r"\{([^{}]+)\}", info_field)
-        if match:
-            first_set = match.group(1)
-            elements = first_set.split("|")
-            return elements
-        else:
-            return []
+        for record, row in zip(records, scores.tolist()):
+            record.extend("" if value != value else str(value) for value in row)
+        return records
 
-    def create_exomiser_tsv(self, phen2gene):
+    def exomiser_records(self, phen2gene):
         """
-        The create_exomiser_tsv function:
-            This function takes the exomiser annotated vcf file and extracts
-            the annotation, writes the relevant information to a tsv file. It
-            also adds the phen2gene rank for the gene associated with the
-            variant. If that gene is not in the phen2gene list, the lowest rank
-            is assigned.
+        The exomiser_records function:
+            This function reads the exomiser annotated vcf file and yields for
+            every variant a list with the position, the exomiser gene combined
+            score as a string and the phen2gene rank for the gene associated
+            with the variant. If that gene is not in the phen2gene list, the
+            lowest rank is assigned.
         """
         exomiser_object = VCF(self.exomiser)
-        phen2gene_df = pd.read_csv(phen2gene, delimiter="\t")
-        phen2gene_df.set_index("Gene", inplace=True)
-        with open(self.output + "-exomiser.tsv", "w") as file_out:
-            file_out.write(
-                "CHROM\tPOS\tREF\tALT\tCLASS\tEXOMISER_GENE_COMBINED_SCORE\tPHEN2GENE_RANK\n"
+        exomiser_extractor = AnnotationParser(
+            exomiser_object
+        ).exomiser_extractor(["EXOMISER_GENE_COMBINED_SCORE", "GENE_SYMBOL"])
+        for variant in exomiser_object:
+            exomiser_score, gene = exomiser_extractor(
+                variant.INFO.get("Exomiser", "")
             )
-            for variant in exomiser_object:
-                chrom = variant.CHROM
-                pos = variant.POS
-                ref = variant.REF
-                alt = variant.ALT[0] if variant.ALT else ""
-                class_info = variant.INFO.get("Class", "")
-                exomiser_annotation = self.parse_exomiser_info(
-                    variant.INFO.get("Exomiser", "")
-                )
-                exomiser_annotation_dict = dict(
-                    zip(self.exomiser_annotation, exomiser_annotation)
-                )
-                exomiser_score = exomiser_annotation_dict[
-                    "EXOMISER_GENE_COMBINED_SCORE"
-                ]
-                if (
-                    exomiser_annotation_dict["GENE_SYMBOL"]
-                    in phen2gene_df.index
-                ):
-                    phen2gene_rank = phen2gene_df.loc[
-                        exomiser_annotation_dict["GENE_SYMBOL"], "Rank"
-                    ]
-                else:
-                    phen2gene_rank = 10843
-                file_out.write(
-                    f"{chrom}\t{pos}\t{ref}\t{alt}\t{class_info}\t{exomiser_score}\t{phen2gene_rank}\n"
-                )
+            yield [
+                variant.CHROM,
+                variant.POS,
+                variant.REF,
+                variant.ALT[0] if variant.ALT else "",
+                str(float(exomiser_score)) if exomiser_score else "",
+                phen2gene.rank(gene),
+            ]
 
-    def combine_tsv(self):
+    def contig_order(self):
         """
-        The combine_tsv function:
-            This function combines the vep tsv and exomisert tsv files based
-            on the values in the chromosome, position, reference and
-            alternative columns. The columns are renamed and written to a new
-            tsv file.
+        The contig_order function:
+            This function reads the contig names from the header of the vep
+            annotated vcf file, or the exomiser annotated vcf file if the first
+            has none, and returns a dictionary with the index of each contig.
+            Both files are expected to be sorted in this order. A file that
+            cannot be read raises its error.
         """
-        vep_df = pd.read_csv(
-            self.output + "-vep.tsv",
-            delimiter="\t",
-            dtype=self.dtype_options_vep,
-        )
-        exomiser_df = pd.read_csv(
-            self.output + "-exomiser.tsv",
-            delimiter="\t",
-            dtype=self.dtype_options_exomiser,
+        for vcf_file in [self.vep, self.exomiser]:
+            seqnames = VCF(vcf_file).seqnames
+            if seqnames:
+                return {contig: index for index, contig in enumerate(seqnames)}
+        raise ValueError(
+            "The vep and exomiser vcf files have no contig header lines."
         )
-        merged_df = pd.merge(
-            vep_df,
-            exomiser_df,
-            on=["CHROM", "POS", "REF", "ALT"],
-            suffixes=("_exomiser", "_vep"),
-            how="inner",
+
+    def position_groups(self, records, contig_order, vcf_file):
+        """
+        The position_groups function:
+            This function groups consecutive records with the same contig and
+            position. For every group a tuple of the sort key (the contig index
+            and the position) and the list of records is yielded. A record that
+            is not in coordinate order raises a ValueError.
+        """
+        key = None
+        group = []
+        for record in records:
+            if record[0] not in contig_order:
+                raise ValueError(
+                    f"Contig {record[0]} of {vcf_file} is not in the header."
+                )
+            record_key = (contig_order[record[0]], record[1])
+            if record_key != key:
+                if group:
+                    yield key, group
+                if key is not None and record_key < key:
+                    raise ValueError(
+                        f"{vcf_file} is not coordinate-sorted at"
+                        f" {record[0]}:{record[1]}."
+                    )
+                key = record_key
+                group = []
+            group.append(record)
+        if group:
+            yield key, group
+
+    def merge_records(self, transcripts, phen2gene):
+        """
+        The merge_records function:
+            This function walks the vep and exomiser annotated vcf files in
+            lockstep, matching variants on chromosome, position, reference and
+            alternative. Only the variants at the current position are kept in
+            memory. For every match the vep record is yielded, extended with
+            the exomiser score and phen2gene rank, in the order of the vep file.
+        """
+        contig_order = self.contig_order()
+        exomiser_groups = self.position_groups(
+            self.exomiser_records(phen2gene), contig_order, self.exomiser
         )
-        merged_df = merged_df.drop(columns=["CLASS_vep"])
-        combined_columns = [
-            "CHROM",
-            "POS",
-            "REF",
-            "ALT",
-            "CLASS",
-            "CADD_PHRED",
-            "CADD_RAW",
-            "CAPICE_SCORE",
-            "FATHMM_MKL_C",
-            "FATHMM_MKL_NC",
-            "EXOMISER_GENE_COMBINED_SCORE",
-            "PHEN2GENE_RANK",
-        ]
-        merged_df.columns = combined_columns
-        merged_df.to_csv(self.output + "-combined.tsv", sep="\t", index=False)
-
-    def custom_normalisation(self, x, benign_range, pathogenic_range):
-        """
-        The custom_normalisation function:
-            This function takes a value, and two lists. These lists represent
-            a range in which the value could be. Depending on the value, it is
-            scaled to either a score between 0 and 0.5 or 0.5 and 1.0. This
-            score is returned.
-        """
-        if x <= benign_range[1]:
-            return (
-                0.5
-                * (x - benign_range[0])
-                / (benign_range[1] - benign_range[0])
-            )
-        else:
-            return 0.5 + 0.5 * (x - pathogenic_range[0]) / (
-                pathogenic_range[1] - pathogenic_range[0]
+        exomiser_group = next(exomiser_groups, None)
+        for key, vep_group in self.position_groups(
+            self.vep_records(transcripts), contig_order, self.vep
+        ):
+            while exomiser_group is not None and exomiser_group[0] < key:
+                exomiser_group = next(exomiser_groups, None)
+            if exomiser_group is None:
+                break
+            if exomiser_group[0] != key:
+                continue
+            for vep_record in vep_group:
+                for exomiser_record in exomiser_group[1]:
+                    if vep_record[2:4] == exomiser_record[2:4]:
+                        yield vep_record + exomiser_record[4:]
+
+    def create_combined_tsv(self, transcripts, phen2gene):
+        """
+        The create_combined_tsv function:
+            This function writes the merged vep and exomiser records to the
+            combined tsv file.
+        """
+        with open(self.output + "-combined.tsv", "w") as file_out:
+            file_out.write(
+                "CHROM\tPOS\tREF\tALT\tCLASS\tSAMPLE\tCADD_PHRED\tCADD_RAW\tCAPICE_SCORE\tFATHMM_MKL_C\tFATHMM_MKL_NC\tEXOMISER_GENE_COMBINED_SCORE\tPHEN2GENE_RANK\n"
             )
+            for record in self.merge_records(transcripts, phen2gene):
+                file_out.write("\t".join(map(str, record)) + "\n")
 
     def normalise_training_data(self):
         """
         The normalise_training_data function:
             This function takes the combined score tsv, scales the values
             through knowledge-based scaling, min-max scaling and max scaling.
-            These scaled scores are written to a file.
+            These scaled scores are written to a file, the fitted ranges are
+            written to a json file that rank-variants.py can use.
         """
         # Load the input table.
         combined_df = pd.read_csv(
@@ -342,72 +346,192 @@ class TSV:
             delimiter="\t",
             dtype=self.dtype_options_combined,
         )
-        # Define the total set of features.
-        features = [
-            "CADD_PHRED",
-            "CADD_RAW",
-            "CAPICE_SCORE",
-            "FATHMM_MKL_C",
-            "FATHMM_MKL_NC",
-            "EXOMISER_GENE_COMBINED_SCORE",
-            "PHEN2GENE_RANK",
-        ]
-        # Define the thresholds for the negative value features.
-        feature_threholds = {
-            "CADD_RAW": 1.654,
-            "FATHMM_MKL_C": 0.123,
-            "FATHMM_MKL_NC": 0.2137,
-        }
         # Remove rows with missing values.
+        features = ScoreNormaliser.features
         combined_df_clean = combined_df.dropna(subset=features)
         combined_df_clean = combined_df_clean.dropna(subset=["CLASS"])
-        # Normalise the CADD PHRED values to a range between 0 and 1 using
-        # min max scaling.
-        combined_df_clean["CADD_PHRED_NORMALISED"] = (
-            combined_df_clean["CADD_PHRED"]
-            + (abs(min(combined_df_clean["CADD_PHRED"])) + 1)
-        ) / max(combined_df_clean["CADD_PHRED"])
-        print(
-            "CADD_PHRED min: "
-            + str((abs(min(combined_df_clean["CADD_PHRED"])) + 1))
+        # Fit the ranges of each feature: min max scaling for CADD PHRED,
+        # knowledge based normalisation for the features with negative values
+        # and max scaling for the PHEN2GENE ranking.
+        normaliser = ScoreNormaliser.fit(
+            combined_df_clean[features].to_numpy(dtype=float)
         )
-        print("CADD_PHRED max: " + str(max(combined_df_clean["CADD_PHRED"])))
-        # Normalise features with negative values based on benign and
-        # pathogenic ranges, through the use of knowledge based normaliation.
-        for feature in ["CADD_RAW", "FATHMM_MKL_C", "FATHMM_MKL_NC"]:
-            benign_range = [
-                min(combined_df_clean[feature]),
-                feature_threholds[feature],
-            ]
-            pathogenic_range = [
-                feature_threholds[feature],
-                max(combined_df_clean[feature]),
-            ]
-            combined_df_clean[feature + "_NORMALISED"] = combined_df_clean[
-                feature
-            ].apply(
-                lambda x: self.custom_normalisation(
-                    x, benign_range, pathogenic_range
-                )
+        self.print_ranges(normaliser)
+        normaliser.save(self.output + "-normalisation.json")
+        self.add_normalised_scores(combined_df_clean, normaliser).to_csv(
+            self.output + "-combined-clean-normalised.tsv",
+            sep="\t",
+            index=False,
+        )
+
+    def print_ranges(self, normaliser):
+        """
+        The print_ranges function:
+            This function prints the fitted ranges of a score normaliser.
+        """
+        ranges = normaliser.ranges
+        print("CADD_PHRED min: " + str(ranges["CADD_PHRED"]["shift"]))
+        print("CADD_PHRED max: " + str(ranges["CADD_PHRED"]["maximum"]))
+        for feature in ScoreNormaliser.thresholds:
+            print(
+                "Benign range: "
+                + str(feature)
+                + ": "
+                + str(ranges[feature]["benign"])
             )
-            print("Benign range: " + str(feature) + ": " + str(benign_range))
             print(
                 "Pathogenic range: "
                 + str(feature)
                 + ": "
-                + str(pathogenic_range)
+                + str(ranges[feature]["pathogenic"])
             )
-        # Normalise the PHEN2GENE ranking to be within a 0 to 1 range.
-        combined_df_clean["PHEN2GENE_RANK_NORMALISED"] = 1 - (
-            combined_df_clean["PHEN2GENE_RANK"]
-            / max(combined_df_clean["PHEN2GENE_RANK"])
+        print("PHEN2GENE max: " + str(ranges["PHEN2GENE_RANK"]["maximum"]))
+
+    def add_normalised_scores(self, df, normaliser):
+        """
+        The add_normalised_scores function:
+            This function adds the normalised CADD, FATHMM and PHEN2GENE
+            columns to a dataframe of clean variants, which is returned.
+        """
+        features = ScoreNormaliser.features
+        normalised_scores = normaliser.normalise(
+            df[features].to_numpy(dtype=float)
         )
-        print("PHEN2GENE max: " + str(max(combined_df_clean["PHEN2GENE_RANK"])))
-        combined_df_clean.to_csv(
+        for feature in [
+            "CADD_PHRED",
+            "CADD_RAW",
+            "FATHMM_MKL_C",
+            "FATHMM_MKL_NC",
+            "PHEN2GENE_RANK",
+        ]:
+            df[feature + "_NORMALISED"] = normalised_scores[
+                :, features.index(feature)
+            ]
+        return df
+
+    def clean_chunks(self):
+        """
+        The clean_chunks function:
+            This function reads the combined score tsv in chunks of chunk_size
+            variants and yields each chunk without the variants that miss a
+            score or class.
+        """
+        with pd.read_csv(
+            self.output + "-combined.tsv",
+            delimiter="\t",
+            dtype=self.dtype_options_combined,
+            chunksize=self.chunk_size,
+        ) as reader:
+            for chunk in reader:
+                chunk = chunk.dropna(subset=ScoreNormaliser.features)
+                yield chunk.dropna(subset=["CLASS"])
+
+    def normalise_training_chunks(self):
+        """
+        The normalise_training_chunks function:
+            This function does the same as normalise_training_data, but reads
+            the combined score tsv in chunks. The first pass collects the
+            minimum and maximum of each feature and the number of variants of
+            each class, the second pass writes the scaled scores chunk by
+            chunk, so memory use does not depend on the size of the table.
+        """
+        features = ScoreNormaliser.features
+        minimum = np.full(len(features), np.inf)
+        maximum = np.full(len(features), -np.inf)
+        for chunk in self.clean_chunks():
+            scores = chunk[features].to_numpy(dtype=float)
+            if len(scores):
+                minimum = np.minimum(minimum, scores.min(axis=0))
+                maximum = np.maximum(maximum, scores.max(axis=0))
+        if not np.isfinite(minimum).all():
+            raise ValueError(
+                "The combined table has no variants with all scores and a"
+                " class to fit the normalisation on."
+            )
+        normaliser = ScoreNormaliser.from_extremes(minimum, maximum)
+        self.print_ranges(normaliser)
+        normaliser.save(self.output + "-normalisation.json")
+        header = True
+        for chunk in self.clean_chunks():
+            self.add_normalised_scores(chunk, normaliser).to_csv(
+                self.output + "-combined-clean-normalised.tsv",
+                sep="\t",
+                index=False,
+                header=header,
+                mode="w" if header else "a",
+            )
+            header = False
+
+    def class_counts(self):
+        """
+        The class_counts function:
+            This function reads only the class column of the scaled scores in
+            chunks and returns the number of variants of each class.
+        """
+        class_counts = {}
+        with pd.read_csv(
             self.output + "-combined-clean-normalised.tsv",
-            sep="\t",
-            index=False,
+            delimiter="\t",
+            usecols=["CLASS"],
+            dtype={"CLASS": "str"},
+            chunksize=self.chunk_size,
+        ) as reader:
+            for chunk in reader:
+                for label, count in chunk["CLASS"].value_counts().items():
+                    class_counts[label] = class_counts.get(label, 0) + count
+        return class_counts
+
+    def incremental_classifier(self, seed, epochs):
+        """
+        The incremental_classifier function:
+            This function reads the scaled scores in chunks and fits a
+            logistic regression with stochastic gradient descent, one chunk at
+            a time. The table is sorted by position, so the variants of each
+            chunk are shuffled with the seed and the table is read for a
+            number of epochs. The classes are weighted by their counts so the
+            rare pathogenic variants count as much as the benign variants. The
+            coefficient of each feature is printed.
+        """
+        labels = {"Benign": 0, "Pathogenic": 1}
+        class_counts = self.class_counts()
+        total = sum(class_counts.values())
+        class_weight = {
+            labels[label]: total / (len(labels) * count)
+            for label, count in class_counts.items()
+            if label in labels
+        }
+        if not class_weight:
+            raise ValueError(
+                "The scaled scores have no Benign or Pathogenic variants to"
+                " fit the classifier on."
+            )
+        classifier = SGDClassifier(
+            loss="log_loss", class_weight=class_weight, random_state=seed
         )
+        generator = np.random.default_rng(seed)
+        for _ in range(epochs):
+            with pd.read_csv(
+                self.output + "-combined-clean-normalised.tsv",
+                delimiter="\t",
+                dtype=self.dtype_options_combined_clean_normalised,
+                chunksize=self.chunk_size,
+            ) as reader:
+                for chunk in reader:
+                    y = chunk["CLASS"].map(labels).to_numpy()
+                    rows = np.flatnonzero(~np.isnan(y))
+                    if not len(rows):
+                        continue
+                    rows = generator.permutation(rows)
+                    classifier.partial_fit(
+                        chunk[self.normalised_features].to_numpy()[rows],
+                        y[rows].astype(int),
+                        classes=np.array([0, 1]),
+                    )
+        print("Feature Coefficients:")
+        for feature, coefficient in zip(
+            self.normalised_features, classifier.coef_[0]
+        ):
+            print(f"{feature}: {coefficient}")
 
     def random_forest_classifier(self):
         """
@@ -421,17 +545,8 @@ class TSV:
             delimiter="\t",
             dtype=self.dtype_options_combined_clean_normalised,
         )
-        # Define the total set of normalised features.
-        normalised_features = [
-            "CADD_PHRED_NORMALISED",
-            "CADD_RAW_NORMALISED",
-            "CAPICE_SCORE",
-            "FATHMM_MKL_C_NORMALISED",
-            "FATHMM_MKL_NC_NORMALISED",
-            "EXOMISER_GENE_COMBINED_SCORE",
-            "PHEN2GENE_RANK_NORMALISED",
-        ]
         # Create a random forest classifier.
+        normalised_features = self.normalised_features
         X = df[normalised_features]
         y = df["CLASS"].map({"Benign": 0, "Pathogenic": 1})
         rf = RandomForestClassifier()
@@ -446,6 +561,263 @@ class TSV:
         for feature, importance in feature_importance_dict.items():
             print(f"{feature}: {importance}")
 
+    def model_file(self, model_folder, data_digest, parameters, fold, seed):
+        """
+        The model_file function:
+            This function returns the full path to the cached forest of a fold
+            (or "all" for the final forest), named after a hash of the training
+            data, the fold, the seed and the hyperparameters.
+        """
+        key = hashlib.sha256(
+            json.dumps(
+                {
+                    "data": data_digest,
+                    "parameters": parameters,
+                    "fold": fold,
+                    "seed": seed,
+                },
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+        return os.path.join(model_folder, key + ".joblib")
+
+    def cached_forest(self, model_file, parameters, X, y, seed, cores=1):
+        """
+        The cached_forest function:
+            This function loads a fitted random forest classifier from the
+            model file. If the model file does not exist, the forest is fitted
+            and written to the model file.
+        """
+        if os.path.exists(model_file):
+            return joblib.load(model_file)
+        forest = RandomForestClassifier(
+            random_state=seed, n_jobs=cores, **parameters
+        )
+        forest.fit(X, y)
+        temp_file = model_file + ".tmp"
+        joblib.dump(forest, temp_file)
+        os.replace(temp_file, model_file)
+        return forest
+
+    def fit_fold(self, model_file, parameters, X, y, train, test, seed):
+        """
+        The fit_fold function:
+            This function fits (or loads) the forest of one fold and one set
+            of hyperparameters on the training variants, and returns the ROC
+            AUC on the test variants of the fold and the seconds it took.
+        """
+        start = time.perf_counter()
+        forest = self.cached_forest(
+            model_file, parameters, X[train], y[train], seed
+        )
+        score = roc_auc_score(y[test], forest.predict_proba(X[test])[:, 1])
+        return score, time.perf_counter() - start
+
+    def cross_validated_forest(self, folds, cores, model_folder, seed):
+        """
+        The cross_validated_forest function:
+            This function evaluates every set of hyperparameters in the
+            parameter grid with stratified k-fold cross-validation. The forests
+            of all folds and hyperparameters are fitted in a single parallel
+            run and cached in the model folder, so a rerun with the same data
+            and seed only fits what changed. The hyperparameters with the
+            highest mean ROC AUC are used to calculate permutation importances
+            on the test variants of each fold, and for a final forest on all
+            variants. The fitting time of each fold, summed over its forests,
+            is reported.
+        """
+        clean_normalised_file = self.output + "-combined-clean-normalised.tsv"
+        df = pd.read_csv(
+            clean_normalised_file,
+            delimiter="\t",
+            dtype=self.dtype_options_combined_clean_normalised,
+        )
+        X = df[self.normalised_features].to_numpy()
+        y = df["CLASS"].map({"Benign": 0, "Pathogenic": 1}).to_numpy()
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy % 2**32)
+        if not os.path.exists(model_folder):
+            os.makedirs(model_folder)
+        data_digest = file_digest(clean_normalised_file)
+        candidates = list(ParameterGrid(self.parameter_grid))
+        splits = list(
+            StratifiedKFold(folds, shuffle=True, random_state=seed).split(X, y)
+        )
+        print("Seed: " + str(seed))
+        start = time.perf_counter()
+        results = Parallel(n_jobs=cores)(
+            delayed(self.fit_fold)(
+                self.model_file(
+                    model_folder, data_digest, parameters, fold, seed
+                ),
+                parameters,
+                X,
+                y,
+                train,
+                test,
+                seed,
+            )
+            for fold, (train, test) in enumerate(splits)
+            for parameters in candidates
+        )
+        results = np.array(results).reshape(folds, len(candidates), 2)
+        scores = results[:, :, 0]
+        for fold in range(folds):
+            print(
+                f"Fold {fold + 1}/{folds}: "
+                f"{results[fold, :, 1].sum():.2f} seconds, "
+                f"best ROC AUC {scores[fold].max()}"
+            )
+        print(f"Cross-validation: {time.perf_counter() - start:.2f} seconds")
+        mean_scores = scores.mean(axis=0)
+        best = int(np.argmax(mean_scores))
+        parameters = candidates[best]
+        print("Mean ROC AUC per parameter set:")
+        for candidate, score in zip(candidates, mean_scores):
+            print(f"{candidate}: {score}")
+        print("Best parameters: " + str(parameters))
+        start = time.perf_counter()
+        importances = []
+        for fold, (train, test) in enumerate(splits):
+            forest = self.cached_forest(
+                self.model_file(
+                    model_folder, data_digest, parameters, fold, seed
+                ),
+                parameters,
+                X[train],
+                y[train],
+                seed,
+            )
+            importances.append(
+                permutation_importance(
+                    forest,
+                    X[test],
+                    y[test],
+                    scoring="roc_auc",
+                    n_repeats=10,
+                    random_state=seed,
+                    n_jobs=cores,
+                ).importances
+            )
+        importances = np.concatenate(importances, axis=1)
+        print(
+            "Permutation importances "
+            f"({time.perf_counter() - start:.2f} seconds):"
+        )
+        for feature, feature_importances in zip(
+            self.normalised_features, importances
+        ):
+            print(
+                f"{feature}: {feature_importances.mean()}"
+                f" +/- {feature_importances.std()}"
+            )
+        start = time.perf_counter()
+        forest = self.cached_forest(
+            self.model_file(model_folder, data_digest, parameters, "all", seed),
+            parameters,
+            X,
+            y,
+            seed,
+            cores,
+        )
+        print(
+            "Feature Importances "
+            f"({time.perf_counter() - start:.2f} seconds):"
+        )
+        for feature, importance in zip(
+            self.normalised_features, forest.feature_importances_
+        ):
+            print(f"{feature}: {importance}")
+
+    def pathogenic_ranks(self, pathogenic_scores, benign_scores):
+        """
+        The pathogenic_ranks function:
+            This function takes two score matrices, one row per variant and
+            one column per weight vector, and calculates for every pathogenic
+            variant its rank among the benign variants: one plus the number of
+            benign variants that score at least as high. All columns are
+            sorted at once, pathogenic variants are placed before benign
+            variants with an equal score so ties count against them. The rank
+            matrix of the pathogenic variants is returned.
+        """
+        scores = np.vstack([pathogenic_scores, benign_scores])
+        order = np.argsort(scores, axis=0, kind="stable")
+        benign_at_or_after = np.cumsum(
+            (order >= len(pathogenic_scores))[::-1], axis=0
+        )[::-1]
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, benign_at_or_after + 1, axis=0)
+        return ranks[: len(pathogenic_scores)]
+
+    def weight_search(self, candidates, objective, seed):
+        """
+        The weight_search function:
+            This function searches for the weight vector that ranks the
+            pathogenic variants highest. Random weight vectors that sum to one
+            are drawn, the normalised features of all variants are scored for
+            all vectors with a single matrix multiplication (in blocks to bound
+            memory), and the top 1 and top 10 recall of every vector is
+            calculated from the rank of each pathogenic variant among the
+            benign variants of its sample. The best vector for the objective
+            is printed and written to a weights file that rank-variants.py can
+            load, together with the normalisation file that the features were
+            scaled with.
+        """
+        df = pd.read_csv(
+            self.output + "-combined-clean-normalised.tsv",
+            delimiter="\t",
+            dtype=self.dtype_options_combined_clean_normalised,
+        )
+        features = df[self.normalised_features].to_numpy(dtype=float)
+        pathogenic = (df["CLASS"] == "Pathogenic").to_numpy()
+        if "SAMPLE" not in df.columns:
+            raise ValueError(
+                "The scaled scores have no SAMPLE column, rerun the combined"
+                " stage with --force-stage combined."
+            )
+        samples = df["SAMPLE"].to_numpy()
+        rng = np.random.default_rng(seed)
+        weights = rng.dirichlet(
+            np.ones(len(self.normalised_features)), size=candidates
+        )
+        top_1 = np.zeros(candidates)
+        top_10 = np.zeros(candidates)
+        for sample in np.unique(samples):
+            in_sample = samples == sample
+            pathogenic_features = features[in_sample & pathogenic]
+            benign_features = features[in_sample & ~pathogenic]
+            if len(pathogenic_features) == 0:
+                continue
+            block = max(1, self.search_block_size // in_sample.sum())
+            for start in range(0, candidates, block):
+                block_weights = weights[start : start + block].T
+                ranks = self.pathogenic_ranks(
+                    pathogenic_features @ block_weights,
+                    benign_features @ block_weights,
+                )
+                top_1[start : start + block] += (ranks <= 1).sum(axis=0)
+                top_10[start : start + block] += (ranks <= 10).sum(axis=0)
+        top_1 /= max(1, pathogenic.sum())
+        top_10 /= max(1, pathogenic.sum())
+        if objective == "top1":
+            best = np.lexsort((top_10, top_1))[-1]
+        else:
+            best = np.lexsort((top_1, top_10))[-1]
+        print("Weight search over " + str(candidates) + " weight vectors:")
+        print("Top 1 recall: " + str(top_1[best]))
+        print("Top 10 recall: " + str(top_10[best]))
+        with open(self.output + "-weights.tsv", "w") as file_out:
+            file_out.write(
+                "# NORMALISATION="
+                + os.path.abspath(self.output + "-normalisation.json")
+                + "\n"
+            )
+            file_out.write("FEATURE\tWEIGHT\n")
+            for feature, weight in zip(self.normalised_features, weights[best]):
+                feature = feature.removesuffix("_NORMALISED")
+                print(f"{feature}: {weight}")
+                file_out.write(f"{feature}\t{weight}\n")
+
 
 def parse_argvs():
     """
@@ -456,8 +828,8 @@ def parse_argvs():
     description = "This script uses an exomiser and vep annotated vcf file to\
                    build a random forest classifier in order to determine\
                    feature weights."
-    epilog = "This python script has three dependencies: cyvcf2, sklearn and\
-              pandas."
+    epilog = "This python script has four dependencies: cyvcf2, numpy, sklearn\
+              and pandas."
     parser = argparse.ArgumentParser(
         description=description,
         epilog=epilog,
@@ -499,10 +871,143 @@ def parse_argvs():
         default=argparse.SUPPRESS,
         help="the full path to the phen2gene file.",
     )
+    parser.add_argument(
+        "-n",
+        "--transcripts",
+        action="store",
+        dest="transcripts",
+        type=str,
+        choices=AnnotationParser.transcript_modes,
+        default="first",
+        help="which CSQ entries of a variant to use: the first entry, the\
+              highest score of each feature over all entries (worst), or\
+              the canonical transcript (requires VEP --canonical).",
+    )
+    parser.add_argument(
+        "-w",
+        "--weight-search",
+        action="store",
+        dest="weight_search",
+        type=int,
+        default=0,
+        help="instead of the random forest classifier, evaluate this number\
+              of random weight vectors and write the vector with the best\
+              recall to a -weights.tsv file.",
+    )
+    parser.add_argument(
+        "-b",
+        "--search-objective",
+        action="store",
+        dest="search_objective",
+        type=str,
+        choices=["top1", "top10"],
+        default="top10",
+        help="the recall to maximise in the weight search, the other recall\
+              is used to break ties.",
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        action="store",
+        dest="seed",
+        type=int,
+        default=None,
+        help="the seed for drawing random weight vectors, for the\
+              cross-validation folds and forests, and for shuffling the\
+              variants of the incremental classifier.",
+    )
+    parser.add_argument(
+        "-k",
+        "--folds",
+        action="store",
+        dest="folds",
+        type=int,
+        default=0,
+        help="instead of a single random forest classifier, evaluate a\
+              hyperparameter grid with this number of cross-validation\
+              folds and calculate permutation importances.",
+    )
+    parser.add_argument(
+        "-t",
+        "--cores",
+        action="store",
+        dest="cores",
+        type=int,
+        default=-1,
+        help="the number of cores used for the cross-validation, -1 uses\
+              all cores.",
+    )
+    parser.add_argument(
+        "-m",
+        "--model-cache",
+        action="store",
+        dest="model_folder",
+        type=str,
+        default=None,
+        help="the full path to the folder in which the fitted forests of\
+              the cross-validation are cached, by default the output name\
+              with a -models suffix. Forests are only reused when the same\
+              --seed is given.",
+    )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        dest="incremental",
+        help="normalise the combined table in chunks and fit an incremental\
+              logistic regression instead of the random forest classifier,\
+              so memory use does not grow with the number of variants.",
+    )
+    parser.add_argument(
+        "--epochs",
+        action="store",
+        dest="epochs",
+        type=int,
+        default=TSV.epochs,
+        help="the number of passes over the scaled scores of the incremental\
+              classifier, the variants of each chunk are shuffled with\
+              --seed in every pass.",
+    )
+    parser.add_argument(
+        "--sample",
+        action="store",
+        dest="sample",
+        type=str,
+        default=None,
+        help="the sample name of the training variants without a Sample INFO\
+              field, by default the first sample of the vep vcf header or\
+              the name of the vep vcf file. The weight search ranks the\
+              pathogenic variants per sample.",
+    )
+    parser.add_argument(
+        "-c",
+        "--chunk-size",
+        action="store",
+        dest="chunk_size",
+        type=int,
+        default=TSV.chunk_size,
+        help="the number of variants that are read as one chunk.",
+    )
+    parser.add_argument(
+        "-f",
+        "--force-stage",
+        action="append",
+        dest="force_stages",
+        choices=TSV.stages + ["all"],
+        default=[],
+        help="run this stage even if its inputs did not change since the\
+              last run, can be given more than once.",
+    )
     parser.add_argument(
         "-v", "--version", action="version", version="%(prog)s [1.0]]"
     )
     argvs = parser.parse_args()
+    if argvs.incremental and (argvs.weight_search or argvs.folds):
+        parser.error(
+            "--incremental can not be combined with --weight-search or --folds."
+        )
+    if argvs.epochs < 1:
+        parser.error("--epochs has to be at least 1.")
     return argvs
 
 
@@ -516,12 +1021,64 @@ def main():
         user_arguments.vep_training,
         user_arguments.exomiser_training,
         user_arguments.output_path_training,
+        user_arguments.chunk_size,
+        user_arguments.sample,
     )
-    create_tsv.create_vep_tsv()
-    create_tsv.create_exomiser_tsv(user_arguments.phen2gene_file)
-    create_tsv.combine_tsv()
-    create_tsv.normalise_training_data()
-    create_tsv.random_forest_classifier()
+    output = user_arguments.output_path_training
+    stage_cache = StageCache(
+        output + "-manifest.json", user_arguments.force_stages
+    )
+    stage_cache.run(
+        "combined",
+        [
+            user_arguments.vep_training,
+            user_arguments.exomiser_training,
+            user_arguments.phen2gene_file,
+        ],
+        {
+            "transcripts": user_arguments.transcripts,
+            "sample": user_arguments.sample,
+        },
+        [output + "-combined.tsv"],
+        lambda: create_tsv.create_combined_tsv(
+            user_arguments.transcripts,
+            Phen2GeneTable(user_arguments.phen2gene_file),
+        ),
+    )
+    stage_cache.run(
+        "normalised",
+        [output + "-combined.tsv"],
+        {},
+        [
+            output + "-combined-clean-normalised.tsv",
+            output + "-normalisation.json",
+        ],
+        (
+            create_tsv.normalise_training_chunks
+            if user_arguments.incremental
+            else create_tsv.normalise_training_data
+        ),
+    )
+    if user_arguments.incremental:
+        create_tsv.incremental_classifier(
+            user_arguments.seed, user_arguments.epochs
+        )
+    elif user_arguments.weight_search:
+        create_tsv.weight_search(
+            user_arguments.weight_search,
+            user_arguments.search_objective,
+            user_arguments.seed,
+        )
+    elif user_arguments.folds:
+        create_tsv.cross_validated_forest(
+            user_arguments.folds,
+            user_arguments.cores,
+            user_arguments.model_folder
+            or user_arguments.output_path_training + "-models",
+            user_arguments.seed,
+        )
+    else:
+        create_tsv.random_forest_classifier()
 
 
 if __name__ == "__main__":
@@ -24,8 +24,8 @@
 import argparse
 import multiprocessing
 import os
-import re
 from cyvcf2 import VCF
+from vcf_annotation import AnnotationParser
 
 
 class Collect:
@@ -170,21 +170,6 @@ class Tabular:
         else:
             self._vcf_collection = [value[1], value[0]]
 
-    def parse_exomiser_info(self, info_field):
-        """
-        The parse_exomiser_info function:
-            This function selects a string in between two brackets. It selects
-            the first element/group and splits on a pipe character. The list is
-            returned.
-        """
-        match = re.match(r"\{([^{}]+)\}", info_field)
-        if match:
-            first_set = match.group(1)
-            elements = first_set.split("|")
-            return elements
-        else:
-            return []
-
     def create_tsv(self):
         """
         The create_tsv function:
@@ -206,7 +191,18 @@ class Tabular:
             list of pathogenic variants, matches are again classified
             pathogenic, the others are benign.
         """
-        pass_only_ids = []
+        pass_only_ids = set()
+        exomiser_fields = self.column_names[:-2]
+        id_index = exomiser_fields.index("ID")
+        acmg_indices = [
+            exomiser_fields.index(field)
+            for field in [
+                "EXOMISER_ACMG_CLASSIFICATION",
+                "EXOMISER_ACMG_EVIDENCE",
+                "EXOMISER_ACMG_DISEASE_ID",
+                "EXOMISER_ACMG_DISEASE_NAME",
+            ]
+        ]
         for vcf_file in self.vcf_collection:
             mode = vcf_file.split("/")[-3]
             output_file = (
@@ -220,33 +216,28 @@ class Tabular:
             with open(output_file, "w") as file_out:
                 file_out.write("\t".join(self.column_names) + "\n")
                 vcf = VCF(vcf_file)
+                exomiser_extractor = AnnotationParser(vcf).exomiser_extractor(
+                    exomiser_fields
+                )
                 for variant in vcf:
                     known_class = variant.INFO.get("Class", "N/A")
-                    exomiser_info = self.parse_exomiser_info(
-                        variant.INFO.get("Exomiser", "N/A")
-                    )
-                    info_dictionary = dict(
-                        zip(self.column_names, exomiser_info)
+                    exomiser_info = list(
+                        exomiser_extractor(variant.INFO.get("Exomiser", "N/A"))
                     )
-                    info_dictionary["KNOWN_CLASS"] = known_class
                     if mode == "PASS_ONLY":
-                        info_dictionary["PREDICTED_CLASS"] = "Pathogenic"
-                        pass_only_ids.append(info_dictionary["ID"])
+                        predicted_class = "Pathogenic"
+                        pass_only_ids.add(exomiser_info[id_index])
                     elif mode == "FULL":
                         predicted_class = (
                             "Pathogenic"
-                            if info_dictionary["ID"] in pass_only_ids
+                            if exomiser_info[id_index] in pass_only_ids
                             else "Benign"
                         )
-                        info_dictionary["PREDICTED_CLASS"] = predicted_class
-                    info_dictionary["EXOMISER_ACMG_CLASSIFICATION"] = "UNKNOWN"
-                    info_dictionary["EXOMISER_ACMG_EVIDENCE"] = "UNKNOWN"
-                    info_dictionary["EXOMISER_ACMG_DISEASE_ID"] = "UNKNOWN"
-                    info_dictionary["EXOMISER_ACMG_DISEASE_NAME"] = "UNKNOWN"
+                    for index in acmg_indices:
+                        exomiser_info[index] = "UNKNOWN"
                     file_out.write(
                         "\t".join(
-                            str(info_dictionary.get(col, ""))
-                            for col in self.column_names
+                            exomiser_info + [known_class, predicted_class]
                         )
                         + "\n"
                     )
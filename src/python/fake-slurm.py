@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# -----------------------------------------------------------------------------
+# GenomeScan internship repository.
+# Copyright (C) 2023 Jasper Boom
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Contact information: info@jboom.org.
+# -----------------------------------------------------------------------------
+
+# Imports:
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+class FakeSlurm:
+    """
+    The FakeSlurm class:
+        This class stands in for the sbatch, squeue and sacct commands of
+        slurm, so the job monitoring of prepare-exomiser-files.py can be tested
+        on a computer without slurm. sbatch runs the --wrap command right away,
+        once for every index of an --array, and records the state of every
+        job in a json file. The exit code of the command decides the state:
+        0 is COMPLETED, 137 (killed) is OUT_OF_MEMORY, 124 (timeout) is
+        TIMEOUT and any other code is FAILED. squeue lists no jobs, because
+        every job is done when sbatch returns, and sacct prints the recorded
+        states.
+
+        This function creates a class attribute:
+            exit_states = a dictionary with the slurm state of an exit code.
+    """
+
+    exit_states = {0: "COMPLETED", 137: "OUT_OF_MEMORY", 124: "TIMEOUT"}
+
+    def __init__(self, state_folder):
+        """
+        The initializer function:
+            This function creates a number of instance attributes:
+                state_file = the full path to the json file with the jobs.
+                jobs = a dictionary with the state of every job id.
+        """
+        os.makedirs(state_folder, exist_ok=True)
+        self.state_file = os.path.join(state_folder, "jobs.json")
+        self.jobs = {}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, "r") as file:
+                self.jobs = json.load(file)
+
+    def save(self):
+        """
+        The save function:
+            This function writes the states of all jobs to the json file.
+        """
+        with open(self.state_file, "w") as file_out:
+            json.dump(self.jobs, file_out, indent=4)
+
+    def array_indices(self, array):
+        """
+        The array_indices function:
+            This function converts an --array value like 0-99%10 or 3,7 to a
+            list of indices, the throttle is ignored.
+        """
+        indices = []
+        for part in array.split("%")[0].split(","):
+            if "-" in part:
+                start, end = part.split("-")
+                indices.extend(range(int(start), int(end) + 1))
+            else:
+                indices.append(int(part))
+        return indices
+
+    def sbatch(self, arguments):
+        """
+        The sbatch function:
+            This function runs the --wrap command of a job, or of every task
+            of a job array, and prints the new job id.
+        """
+        parser = argparse.ArgumentParser(prog="sbatch")
+        parser.add_argument("--job-name", default="wrap")
+        parser.add_argument("--array", default=None)
+        parser.add_argument("--output", default="slurm-%j.out")
+        parser.add_argument("--error", default=None)
+        parser.add_argument("--wrap", required=True)
+        parser.add_argument("--parsable", action="store_true")
+        options, _ = parser.parse_known_args(arguments)
+        job_id = str(
+            max([int(job.split("_")[0]) for job in self.jobs] + [1000]) + 1
+        )
+        indices = self.array_indices(options.array) if options.array else [None]
+        for index in indices:
+            task_id = job_id if index is None else f"{job_id}_{index}"
+            environment = dict(os.environ, SLURM_JOB_ID=job_id)
+            if index is not None:
+                environment["SLURM_ARRAY_JOB_ID"] = job_id
+                environment["SLURM_ARRAY_TASK_ID"] = str(index)
+            names = {
+                "%A": job_id,
+                "%a": str(index),
+                "%j": job_id,
+                "%x": options.job_name,
+            }
+            output_file = options.output
+            error_file = options.error or options.output
+            for pattern, value in names.items():
+                output_file = output_file.replace(pattern, value)
+                error_file = error_file.replace(pattern, value)
+            with open(output_file, "a") as output, open(
+                error_file, "a"
+            ) as error:
+                exit_code = subprocess.run(
+                    options.wrap,
+                    shell=True,
+                    env=environment,
+                    stdout=output,
+                    stderr=error,
+                ).returncode
+            self.jobs[task_id] = self.exit_states.get(exit_code, "FAILED")
+            self.save()
+        print(job_id)
+
+    def sacct(self, arguments):
+        """
+        The sacct function:
+            This function prints the job id and state of the requested jobs,
+            and of every task of a requested job array, separated by a pipe.
+        """
+        parser = argparse.ArgumentParser(prog="sacct")
+        parser.add_argument("--jobs", "-j", default="")
+        options, _ = parser.parse_known_args(arguments)
+        requested = options.jobs.split(",") if options.jobs else []
+        for task_id, state in self.jobs.items():
+            if not requested or task_id.split("_")[0] in requested:
+                print(f"{task_id}|{state}")
+
+    def squeue(self, arguments):
+        """
+        The squeue function:
+            This function prints nothing, there are never active jobs.
+        """
+        pass
+
+
+def main():
+    """
+    The main function:
+        This function runs the slurm command in the first argument with the
+        other arguments. The states are stored in the folder set by the
+        FAKE_SLURM_FOLDER variable.
+    """
+    if len(sys.argv) < 2 or sys.argv[1] not in ["sbatch", "squeue", "sacct"]:
+        sys.exit("Usage: fake-slurm.py {sbatch,squeue,sacct} [arguments]")
+    fake_slurm = FakeSlurm(
+        os.environ.get(
+            "FAKE_SLURM_FOLDER",
+            os.path.join(tempfile.gettempdir(), "fake-slurm"),
+        )
+    )
+    getattr(fake_slurm, sys.argv[1])(sys.argv[2:])
+
+
+if __name__ == "__main__":
+    main()
+
+# Additional information:
+# =======================
+#
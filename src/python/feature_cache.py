@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# -----------------------------------------------------------------------------
+# GenomeScan internship repository.
+# Copyright (C) 2023 Jasper Boom
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Contact information: info@jboom.org.
+# -----------------------------------------------------------------------------
+
+# Imports:
+import hashlib
+import json
+import numpy as np
+import os
+import zipfile
+
+
+def file_digest(file_path, block_size=1048576):
+    """
+    The file_digest function:
+        This function calculates the sha256 hash of the content of a file,
+        reading it in blocks. The hexadecimal hash is returned.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    The FeatureCache class:
+        This class stores the raw feature matrix of a vcf file (the variant
+        positions and the unnormalised scores) in a compressed numpy file. The
+        file name is based on the content hash of the vcf file and the
+        parameters that were used to extract the features, so a cached matrix
+        is only reused for the exact same input. Every chunk is stored as its
+        own set of arrays, so the cache is written and read one chunk at a
+        time and never has to fit in memory as a whole.
+
+        This function creates a number of class attributes:
+            extension = the extension of the cache files.
+    """
+
+    extension = ".chunks.npz"
+
+    def __init__(self, cache_folder, vcf_file, parameters):
+        """
+        The initializer function:
+            This function creates a number of instance attributes:
+                cache_folder = the full path to the folder with cache files.
+                key = a string with the content hash of the vcf file and a
+                      hash of the extraction parameters.
+                cache_file = the full path to the cache file of the vcf file.
+        """
+        self.cache_folder = cache_folder
+        parameter_digest = hashlib.sha256(
+            json.dumps(parameters, sort_keys=True).encode()
+        ).hexdigest()
+        self.key = file_digest(vcf_file) + "-" + parameter_digest[:16]
+        self.cache_file = os.path.join(cache_folder, self.key + self.extension)
+
+    def exists(self):
+        """
+        The exists function:
+            This function checks if the vcf file was cached before.
+        """
+        return os.path.exists(self.cache_file)
+
+    def write_chunks(self, chunks):
+        """
+        The write_chunks function:
+            This function takes an iterable of chunks, each a tuple of four
+            position lists (CHROM, POS, REF and ALT) and a score matrix, and
+            yields them unchanged while every chunk is added to the cache file
+            as soon as it passes. The file is written under a temporary name
+            and only moved into place when all chunks are written, so an
+            interrupted run leaves no partial cache behind.
+        """
+        if not os.path.exists(self.cache_folder):
+            os.makedirs(self.cache_folder)
+        temp_file = self.cache_file + f".{os.getpid()}.tmp"
+        try:
+            with zipfile.ZipFile(
+                temp_file, "w", compression=zipfile.ZIP_DEFLATED
+            ) as archive:
+                for index, (positions, scores) in enumerate(chunks):
+                    arrays = {
+                        "chrom": np.array(positions[0], dtype=str),
+                        "pos": np.array(positions[1], dtype=np.int64),
+                        "ref": np.array(positions[2], dtype=str),
+                        "alt": np.array(
+                            [str(alt) for alt in positions[3]], dtype=str
+                        ),
+                        "scores": scores,
+                    }
+                    for name, array in arrays.items():
+                        with archive.open(
+                            f"{index}_{name}.npy", "w", force_zip64=True
+                        ) as file_out:
+                            np.lib.format.write_array(
+                                file_out, array, allow_pickle=False
+                            )
+                    yield positions, scores
+            os.replace(temp_file, self.cache_file)
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+    def load_chunks(self, chunk_size):
+        """
+        The load_chunks function:
+            This function reads the cache file one stored chunk at a time and
+            yields it in chunks of at most chunk_size variants, in the same
+            form as they were written.
+        """
+        with np.load(self.cache_file) as cache:
+            index = 0
+            while f"{index}_pos" in cache.files:
+                chrom = cache[f"{index}_chrom"]
+                pos = cache[f"{index}_pos"]
+                ref = cache[f"{index}_ref"]
+                alt = cache[f"{index}_alt"]
+                scores = cache[f"{index}_scores"]
+                for start in range(0, len(pos), chunk_size):
+                    end = start + chunk_size
+                    yield [
+                        chrom[start:end].tolist(),
+                        pos[start:end].tolist(),
+                        ref[start:end].tolist(),
+                        alt[start:end].tolist(),
+                    ], scores[start:end]
+                index += 1
+
+
+# Additional information:
+# =======================
+#
@@ -22,7 +22,20 @@
 
 # Imports:
 import argparse
-from cyvcf2 import VCF
+import contextlib
+import gzip
+import json
+import multiprocessing
+import numpy as np
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+from cyvcf2 import VCF, Writer
+from filter_expression import FilterExpression
+from itertools import compress
+from vcf_annotation import AnnotationParser
 
 
 class VEP:
@@ -32,42 +45,19 @@ class VEP:
         The variants that pass all filters are written to a new file.
 
         This function creates a number of class attributes:
-            vep_annotation = a list of strings with the names of each bit of
-                             annotation that VEP could add to a variant.
             score_names = a list of strings with the names of the annotation
                           scores that are used for the filtering.
+            chunk_size = the number of variants of which the annotation
+                         scores are extracted as one batch.
+            region_size = the default number of bases of a region that is
+                          filtered as one task by a process pool.
+            sweep_block_size = the maximum number of votes (variants times
+                               threshold vectors) that are calculated at once
+                               during a threshold sweep.
+            confusion_fields = a list of strings with the names of the counts
+                               of a confusion matrix.
     """
 
-    vep_annotation = [
-        "Allele",
-        "Consequence",
-        "IMPACT",
-        "SYMBOL",
-        "Gene",
-        "Feature_type",
-        "Feature",
-        "BIOTYPE",
-        "EXON",
-        "INTRON",
-        "HGVSc",
-        "HGVSp",
-        "cDNA_position",
-        "CDS_position",
-        "Protein_position",
-        "Amino_acids",
-        "Codons",
-        "Existing_variation",
-        "DISTANCE",
-        "STRAND",
-        "FLAGS",
-        "SYMBOL_SOURCE",
-        "HGNC_ID",
-        "CADD_PHRED",
-        "CADD_RAW",
-        "CAPICE_SCORE",
-        "FATHMM_MKL_C",
-        "FATHMM_MKL_NC",
-    ]
     score_names = [
         "CADD_PHRED",
         "CADD_RAW",
@@ -75,20 +65,54 @@ class VEP:
         "FATHMM_MKL_C",
         "FATHMM_MKL_NC",
     ]
+    chunk_size = 50000
+    region_size = 10000000
+    sweep_block_size = 20000000
+    confusion_fields = [
+        "total_variants",
+        "unknown_variants",
+        "true_positives",
+        "true_negatives",
+        "false_positives",
+        "false_negatives",
+    ]
 
-    def __init__(self, vcf_file, output_name, vep_thresholds):
+    def __init__(
+        self,
+        vcf_file,
+        output_name,
+        vep_thresholds,
+        transcripts="first",
+        compression_threads=1,
+        compress=False,
+        expression=None,
+    ):
         """
         The initializer function:
             This function creates an instance attribute:
                 vcf = the input vcf file that needs to be filtered.
                 output = a string to use as the output name of the filtered vcf
-                         file.
+                         file, - writes to standard output.
                 thresholds = a list of floats to use as thresholds for the
                              annotation scores.
+                transcripts = a string that decides which CSQ entries of a
+                              variant are used: first, worst or canonical.
+                compression_threads = the number of threads htslib uses to
+                                      compress a bgzipped output file.
+                compress = a boolean, True writes the output as BGZF.
+                expression = a compiled FilterExpression that replaces the
+                             majority vote of the thresholds, or None.
+                log = the stream for messages, standard error when the output
+                      is written to standard output.
         """
         self.vcf = vcf_file
         self.output = output_name
         self.thresholds = vep_thresholds
+        self.transcripts = transcripts
+        self.compression_threads = compression_threads
+        self.compress = compress
+        self.expression = FilterExpression(expression) if expression else None
+        self.log = sys.stderr if output_name == "-" else sys.stdout
 
     @property
     def vcf(self):
@@ -107,43 +131,308 @@ class VEP:
         """
         self._vcf = VCF(value)
 
-    def filter_vep(self):
+    def read_chunks(self, region=None):
+        """
+        The read_chunks function:
+            This function reads the vcf file in chunks of chunk_size variants.
+            The annotation scores of each chunk are extracted as one matrix,
+            combining the CSQ entries of a variant as set by transcripts.
+            Each chunk is yielded as a tuple of the list of variants and the
+            score matrix, missing scores are NaN. If a filter expression is
+            used, the matrix is replaced by the string columns of the fields
+            of the expression and the rows at which each variant starts. If a
+            region (a tuple of the contig, start and end) is given, only the
+            variants that start in that region are read, using the index of
+            the vcf file.
+        """
+        parser = AnnotationParser(self.vcf)
+        if self.expression:
+            csq_extractor = parser.csq_column_extractor(
+                self.expression.fields, self.transcripts
+            )
+        else:
+            csq_extractor = parser.csq_matrix_extractor(
+                self.score_names, self.transcripts
+            )
+        variants = []
+        csq_infos = []
+        if region:
+            contig, start, end = region
+            vcf = self.vcf(f"{contig}:{start}-{end}")
+        else:
+            vcf = self.vcf
+        for variant in vcf:
+            if region and not start <= variant.POS <= end:
+                continue
+            variants.append(variant)
+            csq_infos.append(variant.INFO.get("CSQ", ""))
+            if len(variants) == self.chunk_size:
+                yield variants, csq_extractor(csq_infos)
+                variants = []
+                csq_infos = []
+        if variants:
+            yield variants, csq_extractor(csq_infos)
+
+    def classify_chunk(self, scores):
+        """
+        The classify_chunk function:
+            This function applies the input thresholds to a matrix of
+            annotation scores with one row per variant, as one broadcast
+            comparison. Each score above its threshold is a pathogenic vote,
+            missing scores (NaN) never are. Two arrays are returned: whether
+            all scores of a variant are present, and the number of pathogenic
+            votes of a variant.
+        """
+        complete = ~np.isnan(scores).any(axis=1)
+        votes = (scores > self.thresholds).sum(axis=1)
+        return complete, votes
+
+    def evaluate_chunk(self, csq_columns):
+        """
+        The evaluate_chunk function:
+            This function applies the compiled filter expression to the CSQ
+            columns of a chunk. With worst a variant passes if any of its CSQ
+            entries passes. Two arrays are returned: whether the variant could
+            be evaluated, which is always True, and whether the variant passes
+            the expression.
+        """
+        columns, starts = csq_columns
+        passing = self.expression(dict(zip(self.expression.fields, columns)))
+        if self.transcripts == "worst" and len(starts):
+            passing = np.logical_or.reduceat(passing, starts)
+        return np.ones(len(starts), dtype=bool), passing
+
+    def classify(self, scores):
+        """
+        The classify function:
+            This function classifies a chunk with the filter expression, or
+            otherwise with the majority vote of the thresholds. Two arrays are
+            returned: whether the variant could be classified and whether it
+            is called pathogenic.
+        """
+        if self.expression:
+            return self.evaluate_chunk(scores)
+        complete, votes = self.classify_chunk(scores)
+        return complete, 2 * votes > len(self.score_names)
+
+    def has_labels(self):
+        """
+        The has_labels function:
+            This function checks if the vcf header describes the Class INFO
+            field that holds the Benign or Pathogenic label of a variant.
+        """
+        try:
+            self.vcf.get_header_type("Class")
+        except KeyError:
+            return False
+        return True
+
+    def confusion_counts(self, variants, complete, predicted):
+        """
+        The confusion_counts function:
+            This function compares the predicted class of a chunk of variants
+            to their Class labels. An array with the counts of the
+            confusion_fields is returned, variants that miss annotation scores
+            are unknown.
+        """
+        labels = np.array(
+            [variant.INFO.get("Class", "N/A") for variant in variants]
+        )
+        pathogenic = complete & (labels == "Pathogenic")
+        benign = complete & (labels == "Benign")
+        return np.array(
+            [
+                len(variants),
+                (~complete).sum(),
+                (pathogenic & predicted).sum(),
+                (benign & ~predicted).sum(),
+                (benign & predicted).sum(),
+                (pathogenic & ~predicted).sum(),
+            ],
+            dtype=np.int64,
+        )
+
+    def writer(self, output_file):
+        """
+        The writer function:
+            This function opens a cyvcf2 writer with the header of the input
+            vcf file, the output file - is standard output. If compress is set,
+            the output is written as BGZF by htslib, using compression_threads
+            threads.
+        """
+        if self.compress:
+            writer = Writer(output_file, self.vcf, mode="wz")
+            if self.compression_threads > 1:
+                writer.set_threads(self.compression_threads)
+        else:
+            writer = Writer(output_file, self.vcf, mode="w")
+        return writer
+
+    def filter_vep(self, region=None):
         """
         The filter_vep function:
             This function filters a vcf file. It opens a new file, then loops
-            through all variants in the input vcf file. It collects the
-            annotation scores of interest, applies the input thresholds, and
-            checks the final class (if all 5 scores are present). Any variants
-            called pathogenic or with too few annotation scores are written to
-            the new file.
-        """
-        with open(self.output, "w") as file_out:
-            file_out.write(self.vcf.raw_header)
-            for variant in self.vcf:
-                csq_info = variant.INFO.get("CSQ", "N/A")
-                if csq_info != "N/A":
-                    annotation = csq_info.split(",")[0].split("|")
-                    annotation_dict = dict(zip(self.vep_annotation, annotation))
-                    score_classification = []
-                    for key, threshold in zip(
-                        self.score_names, self.thresholds
-                    ):
-                        value = annotation_dict.get(key, None)
-                        if value is not None and value != "":
-                            value = float(value)
-                            if value > threshold:
-                                score_classification.append("Pathogenic")
-                            else:
-                                score_classification.append("Benign")
-                if score_classification and len(score_classification) == 5:
-                    pathogenic_count = score_classification.count("Pathogenic")
-                    benign_count = score_classification.count("Benign")
-                    if pathogenic_count > benign_count:
-                        file_out.write(str(variant))
-                    elif benign_count > pathogenic_count:
-                        pass
-                else:
-                    file_out.write(str(variant))
+            through the input vcf file in chunks. For every chunk the
+            annotation scores of interest are compared to the input thresholds
+            at once, and only the variants called pathogenic or with too few
+            annotation scores are written to the new file by htslib. With a
+            filter expression only the variants that pass it are written. If a
+            region is given, only the variants of that region are written.
+            If the variants have Class labels, the confusion matrix is counted
+            in the same pass and returned as a dictionary, otherwise None is
+            returned.
+        """
+        labelled = self.has_labels()
+        counts = np.zeros(len(self.confusion_fields), dtype=np.int64)
+        writer = self.writer(self.output)
+        for variants, scores in self.read_chunks(region):
+            complete, predicted = self.classify(scores)
+            passing = ~complete | predicted
+            for variant in compress(variants, passing.tolist()):
+                writer.write_record(variant)
+            if labelled:
+                counts += self.confusion_counts(variants, complete, predicted)
+        writer.close()
+        if labelled:
+            return dict(zip(self.confusion_fields, counts.tolist()))
+        return None
+
+    def index_output(self, index_format):
+        """
+        The index_output function:
+            This function creates a tabix (tbi) or CSI index of the bgzipped
+            output file with tabix. A RuntimeError is raised if tabix is not
+            found or fails, so an output without index is never mistaken for
+            a finished one.
+        """
+        command = ["tabix", "-f", "-p", "vcf", self.output]
+        if index_format == "csi":
+            command.insert(1, "-C")
+        try:
+            subprocess.run(command, check=True)
+        except FileNotFoundError:
+            raise RuntimeError(
+                f"tabix was not found, {self.output} is not indexed."
+            )
+        except subprocess.CalledProcessError as error:
+            raise RuntimeError(
+                f"tabix failed with exit code {error.returncode},"
+                f" {self.output} is not indexed."
+            )
+
+    def regions(self, region_size):
+        """
+        The regions function:
+            This function splits the contigs in the vcf header into regions of
+            at most region_size bases, in coordinate order. Contigs without a
+            length in the header are one region. A list of tuples with the
+            contig, start and end of each region is returned.
+        """
+        try:
+            lengths = self.vcf.seqlens
+        except Exception:
+            lengths = []
+        regions = []
+        for index, contig in enumerate(self.vcf.seqnames):
+            length = lengths[index] if index < len(lengths) else 0
+            if length <= 0:
+                regions.append((contig, 1, 2**31 - 1))
+                continue
+            for start in range(1, length + 1, region_size):
+                regions.append(
+                    (contig, start, min(start + region_size - 1, length))
+                )
+        return regions
+
+    def index_contigs(self, vcf_file):
+        """
+        The index_contigs function:
+            This function reads the contig names from the tabix (tbi) or CSI
+            index of the vcf file. A CSI index without a tabix header, as
+            written by bcftools, has no names and gives an empty list.
+        """
+        for extension in [".tbi", ".csi"]:
+            if os.path.exists(vcf_file + extension):
+                break
+        else:
+            return []
+        with gzip.open(vcf_file + extension, "rb") as file:
+            if file.read(4) == b"CSI\x01":
+                _, _, aux_length = struct.unpack("<3i", file.read(12))
+                header = file.read(aux_length)
+            else:
+                file.read(4)
+                header = file.read(28)
+                header += file.read(struct.unpack("<i", header[24:28])[0])
+        if len(header) < 28:
+            return []
+        names = header[28 : 28 + struct.unpack("<i", header[24:28])[0]]
+        return [name.decode() for name in names.split(b"\0") if name]
+
+    def check_contigs(self, vcf_file):
+        """
+        The check_contigs function:
+            This function raises a ValueError if the index of the vcf file has
+            contigs that are not in the vcf header. The regions are made from
+            the header contigs, so the variants of such contigs would be
+            dropped without notice.
+        """
+        header_contigs = set(self.vcf.seqnames)
+        unknown = [
+            contig
+            for contig in self.index_contigs(vcf_file)
+            if contig not in header_contigs
+        ]
+        if unknown:
+            raise ValueError(
+                "The contigs "
+                + ", ".join(unknown)
+                + f" of the index of {vcf_file} are not in the vcf header, add"
+                " contig lines to the header to filter with --threads."
+            )
+
+    def filter_regions(self, vcf_file, threads, region_size):
+        """
+        The filter_regions function:
+            This function filters an indexed vcf file with a pool of threads
+            processes, one region at a time. Every region is filtered to its
+            own temporary file, the variants of these files are written to the
+            output file in coordinate order. The confusion matrices of the
+            regions are summed and returned, or None without Class labels.
+            Contigs of the index that are not in the header raise a
+            ValueError.
+        """
+        self.check_contigs(vcf_file)
+        regions = self.regions(region_size)
+        with tempfile.TemporaryDirectory(
+            dir=os.path.dirname(os.path.abspath(self.output))
+        ) as temp_folder:
+            arguments = [
+                (
+                    vcf_file,
+                    os.path.join(temp_folder, f"{index}.vcf"),
+                    self.thresholds,
+                    self.transcripts,
+                    region,
+                    self.expression.expression if self.expression else None,
+                )
+                for index, region in enumerate(regions)
+            ]
+            pool = multiprocessing.Pool(processes=threads)
+            results = pool.starmap(filter_region, arguments)
+            pool.close()
+            pool.join()
+            writer = self.writer(self.output)
+            for region_file, _ in results:
+                for variant in VCF(region_file):
+                    writer.write_record(variant)
+            writer.close()
+        if not self.has_labels():
+            return None
+        return {
+            field: sum(counts[field] for _, counts in results)
+            for field in self.confusion_fields
+        }
 
     def create_confusion_matrix(self):
         """
@@ -153,54 +442,209 @@ class VEP:
             missing annotation scores are kept for Exomiser instead of
             removed).
         """
+        counts = np.zeros(len(self.confusion_fields), dtype=np.int64)
+        for variants, scores in self.read_chunks():
+            complete, predicted = self.classify(scores)
+            counts += self.confusion_counts(variants, complete, predicted)
+        self.print_confusion_matrix(
+            dict(zip(self.confusion_fields, counts.tolist()))
+        )
+
+    def print_confusion_matrix(self, counts):
+        """
+        The print_confusion_matrix function:
+            This function prints the counts of a confusion matrix.
+        """
+        print(
+            "The total number of variants = " + str(counts["total_variants"]),
+            file=self.log,
+        )
+        print(
+            "The number of unknown variants = "
+            + str(counts["unknown_variants"]),
+            file=self.log,
+        )
+        print("True positives " + str(counts["true_positives"]), file=self.log)
+        print("True negatvies " + str(counts["true_negatives"]), file=self.log)
+        print(
+            "False positives " + str(counts["false_positives"]), file=self.log
+        )
+        print(
+            "False negatives " + str(counts["false_negatives"]), file=self.log
+        )
+
+    def write_confusion_matrix(self, counts, confusion_file):
+        """
+        The write_confusion_matrix function:
+            This function writes the counts of a confusion matrix and the
+            thresholds or filter expression that were used to a json file.
+        """
+        if self.expression:
+            settings = {"expression": self.expression.expression}
+        else:
+            settings = {
+                "thresholds": dict(
+                    zip(self.score_names, map(float, self.thresholds))
+                )
+            }
+        with open(confusion_file, "w") as file_out:
+            json.dump(
+                {**settings, **counts},
+                file_out,
+                indent=4,
+            )
+            file_out.write("\n")
+
+    def labelled_scores(self):
+        """
+        The labelled_scores function:
+            This function reads the vcf file once and keeps the annotation
+            scores of the variants that have all scores and a Benign or
+            Pathogenic Class label. The score matrix, a boolean array that is
+            True for pathogenic variants, the total number of variants and the
+            number of unknown variants (missing scores) are returned.
+        """
+        chunks = []
+        labels = []
         total_variants = 0
         unknown_variants = 0
-        true_positives = 0
-        true_negatives = 0
-        false_positives = 0
-        false_negatives = 0
-        for variant in self.vcf:
-            total_variants += 1
-            csq_info = variant.INFO.get("CSQ", "N/A")
-            class_info = variant.INFO.get("Class", "N/A")
-            if csq_info != "N/A":
-                annotation = csq_info.split(",")[0].split("|")
-                annotation_dict = dict(zip(self.vep_annotation, annotation))
-                score_classification = []
-                for key, threshold in zip(self.score_names, self.thresholds):
-                    value = annotation_dict.get(key, None)
-                    if value is not None and value != "":
-                        value = float(value)
-                        if value > threshold:
-                            score_classification.append("Pathogenic")
-                        else:
-                            score_classification.append("Benign")
-            if score_classification and len(score_classification) == 5:
-                pathogenic_count = score_classification.count("Pathogenic")
-                benign_count = score_classification.count("Benign")
-                if pathogenic_count > benign_count:
-                    predicted_class = "Pathogenic"
-                elif benign_count > pathogenic_count:
-                    predicted_class = "Benign"
-                if (
-                    class_info == "Pathogenic"
-                    and predicted_class == "Pathogenic"
-                ):
-                    true_positives += 1
-                elif class_info == "Benign" and predicted_class == "Benign":
-                    true_negatives += 1
-                elif class_info == "Benign" and predicted_class == "Pathogenic":
-                    false_positives += 1
-                elif class_info == "Pathogenic" and predicted_class == "Benign":
-                    false_negatives += 1
-            else:
-                unknown_variants += 1
-        print("The total number of variants = " + str(total_variants))
-        print("The number of unknown variants = " + str(unknown_variants))
-        print("True positives " + str(true_positives))
-        print("True negatvies " + str(true_negatives))
-        print("False positives " + str(false_positives))
-        print("False negatives " + str(false_negatives))
+        for variants, scores in self.read_chunks():
+            complete = ~np.isnan(scores).any(axis=1)
+            chunk_labels = np.array(
+                [variant.INFO.get("Class", "N/A") for variant in variants]
+            )
+            keep = complete & np.isin(chunk_labels, ["Benign", "Pathogenic"])
+            chunks.append(scores[keep])
+            labels.append(chunk_labels[keep])
+            total_variants += len(variants)
+            unknown_variants += int((~complete).sum())
+        if not chunks:
+            chunks = [np.empty((0, len(self.score_names)))]
+            labels = [np.empty(0, dtype=str)]
+        return (
+            np.concatenate(chunks),
+            np.concatenate(labels) == "Pathogenic",
+            total_variants,
+            unknown_variants,
+        )
+
+    def threshold_grid(self, scores, steps):
+        """
+        The threshold_grid function:
+            This function takes steps evenly spaced quantiles of each score
+            as candidate thresholds and returns every combination of these
+            thresholds as a matrix with one threshold vector per row.
+        """
+        if len(scores) == 0:
+            raise ValueError(
+                "The vcf file has no variants with all scores and a Class."
+            )
+        levels = np.quantile(
+            scores, np.linspace(0.0, 1.0, steps + 2)[1:-1], axis=0
+        )
+        return np.stack(np.meshgrid(*levels.T, indexing="ij"), axis=-1).reshape(
+            -1, len(self.score_names)
+        )
+
+    def sweep_thresholds(self, steps, sweep_file):
+        """
+        The sweep_thresholds function:
+            This function evaluates a grid of threshold vectors on the labelled
+            variants of the vcf file, which is read only once. The majority
+            vote of every variant is calculated for a block of threshold
+            vectors at once. The true positives, true negatives, false
+            positives, false negatives and the ROC point (true and false
+            positive rate) of every threshold vector are written to a tsv
+            file, or to standard output if the file name is -.
+        """
+        scores, pathogenic, total_variants, unknown_variants = (
+            self.labelled_scores()
+        )
+        grid = self.threshold_grid(scores, steps)
+        counts = np.zeros((len(grid), 4), dtype=np.int64)
+        block = max(1, self.sweep_block_size // max(1, len(scores)))
+        for start in range(0, len(grid), block):
+            thresholds = grid[start : start + block]
+            votes = (scores[:, np.newaxis, :] > thresholds).sum(axis=2)
+            predicted = 2 * votes > len(self.score_names)
+            true_positives = predicted[pathogenic].sum(axis=0)
+            false_positives = predicted[~pathogenic].sum(axis=0)
+            counts[start : start + block] = np.column_stack(
+                [
+                    true_positives,
+                    (~pathogenic).sum() - false_positives,
+                    false_positives,
+                    pathogenic.sum() - true_positives,
+                ]
+            )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            true_positive_rate = counts[:, 0] / (counts[:, 0] + counts[:, 3])
+            false_positive_rate = counts[:, 2] / (counts[:, 2] + counts[:, 1])
+        print(
+            "The total number of variants = " + str(total_variants),
+            file=self.log,
+        )
+        print(
+            "The number of unknown variants = " + str(unknown_variants),
+            file=self.log,
+        )
+        print(
+            "The number of threshold vectors = " + str(len(grid)),
+            file=self.log,
+        )
+        if sweep_file == "-":
+            sweep_output = contextlib.nullcontext(sys.stdout)
+        else:
+            sweep_output = open(sweep_file, "w")
+        with sweep_output as file_out:
+            file_out.write(
+                "\t".join(
+                    self.score_names + ["TP", "TN", "FP", "FN", "TPR", "FPR"]
+                )
+                + "\n"
+            )
+            for thresholds, row, tpr, fpr in zip(
+                grid.tolist(),
+                counts.tolist(),
+                true_positive_rate.tolist(),
+                false_positive_rate.tolist(),
+            ):
+                file_out.write(
+                    "\t".join(map(str, thresholds + row + [tpr, fpr])) + "\n"
+                )
+
+
+def filter_region(
+    vcf_file, output_file, vep_thresholds, transcripts, region, expression
+):
+    """
+    The filter_region function:
+        This function is used to filter a single region of an indexed vcf file
+        in a separate process. The filter expression is compiled again in the
+        process. The passing variants are written to the output file. The name
+        of the output file and the confusion matrix of the region are
+        returned.
+    """
+    counts = VEP(
+        vcf_file,
+        output_file,
+        vep_thresholds,
+        transcripts,
+        expression=expression,
+    ).filter_vep(region)
+    return output_file, counts
+
+
+def output_name(vcf_file, extension):
+    """
+    The output_name function:
+        This function returns the name of the input vcf file without its .vcf
+        or .vcf.gz extension, followed by the given extension.
+    """
+    for vcf_extension in [".vcf.gz", ".vcf"]:
+        if vcf_file.endswith(vcf_extension):
+            return vcf_file[: -len(vcf_extension)] + extension
+    return vcf_file + extension
 
 
 def parse_argvs():
@@ -212,7 +656,9 @@ def parse_argvs():
     description = "This python script is used to filter a VEP annotated vcf\
                    file based on input thresholds, the variants that pass the\
                    filter are written to a new file."
-    epilog = "This python script has one dependency: cyvcf2."
+    epilog = "This python script has two dependencies: cyvcf2 and numpy.\
+              Compressed output is indexed with tabix, which has to be\
+              on the PATH."
     parser = argparse.ArgumentParser(
         description=description,
         epilog=epilog,
@@ -225,23 +671,138 @@ def parse_argvs():
         dest="vcf_file",
         type=str,
         default=argparse.SUPPRESS,
-        help="the full path to the input vcf file.",
+        help="the full path to the input vcf file, - reads the vcf file from\
+              standard input.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        action="store",
+        dest="output_file",
+        type=str,
+        default=None,
+        help="the full path to the output vcf file (or sweep table), - writes\
+              to standard output. By default the name of the input vcf file\
+              without its .vcf or .vcf.gz extension and with a\
+              .vep.filtered.vcf extension, or standard output when reading\
+              from standard input.",
     )
     parser.add_argument(
         "-e",
         "--ensembl",
         action="store",
         dest="vep_thresholds",
-        type=list,
+        type=float,
+        nargs=len(VEP.score_names),
+        metavar="THRESHOLD",
         default=[17.18, 1.654, 0.0059, 0.123, 0.2137],
-        help="a list of floats to use as thresholds for vep annotation. The\
+        help="five floats to use as thresholds for vep annotation. The\
               order of annotation scores is: CADD phred, CADD raw, CAPICE,\
-              FATHMM MKL coding, FATHMM MKL, noncoding.",
+              FATHMM MKL coding, FATHMM MKL noncoding.",
+    )
+    parser.add_argument(
+        "-f",
+        "--filter",
+        action="store",
+        dest="expression",
+        type=str,
+        default=None,
+        help="a filter expression over CSQ fields that replaces the majority\
+              vote of the thresholds, for example 'CADD_PHRED > 17 and IMPACT\
+              in {HIGH, MODERATE}'. Comparisons can be joined with and, or,\
+              not and parentheses, other operators are in, not in, contains\
+              and is (not) missing. With --transcripts worst a variant passes\
+              if any CSQ entry passes.",
+    )
+    parser.add_argument(
+        "-n",
+        "--transcripts",
+        action="store",
+        dest="transcripts",
+        type=str,
+        choices=AnnotationParser.transcript_modes,
+        default="first",
+        help="which CSQ entries of a variant to use: the first entry, the\
+              highest score of each feature over all entries (worst), or\
+              the canonical transcript (requires VEP --canonical).",
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        action="store",
+        dest="threads",
+        type=int,
+        default=1,
+        help="the number of processes that filter regions of the vcf file in\
+              parallel, more than one requires a bgzipped vcf file with a\
+              tabix or CSI index.",
+    )
+    parser.add_argument(
+        "-r",
+        "--region-size",
+        action="store",
+        dest="region_size",
+        type=int,
+        default=VEP.region_size,
+        help="the number of bases of a region that is filtered as one task\
+              when using more than one thread.",
+    )
+    parser.add_argument(
+        "-z",
+        "--compress",
+        action="store_true",
+        dest="compress",
+        help="write the filtered vcf file as a bgzipped (.gz) file and index\
+              it with tabix.",
+    )
+    parser.add_argument(
+        "-c",
+        "--compression-threads",
+        action="store",
+        dest="compression_threads",
+        type=int,
+        default=1,
+        help="the number of threads used to compress the output file.",
+    )
+    parser.add_argument(
+        "-x",
+        "--index",
+        action="store",
+        dest="index_format",
+        type=str,
+        choices=["tbi", "csi"],
+        default="tbi",
+        help="the type of index that is created for a compressed output\
+              file.",
+    )
+    parser.add_argument(
+        "-s",
+        "--sweep",
+        action="store",
+        dest="sweep",
+        type=int,
+        default=0,
+        help="instead of filtering, evaluate every combination of this number\
+              of quantile thresholds per score on the Class labels of the vcf\
+              file, and write the confusion matrix and ROC point of each\
+              threshold vector to a vep.sweep.tsv file.",
     )
     parser.add_argument(
         "-v", "--version", action="version", version="%(prog)s [1.0]]"
     )
     argvs = parser.parse_args()
+    if argvs.expression:
+        if argvs.sweep:
+            parser.error("--filter cannot be combined with --sweep.")
+        try:
+            FilterExpression(argvs.expression)
+        except ValueError as error:
+            parser.error(str(error))
+    if argvs.threads > 1 and not any(
+        os.path.exists(argvs.vcf_file + extension)
+        for extension in [".tbi", ".csi"]
+    ):
+        parser.error("--threads requires a tabix or CSI index of the vcf file.")
     return argvs
 
 
@@ -251,13 +812,55 @@ def main():
         This function calls all processing functions in correct order.
     """
     user_arguments = parse_argvs()
-    output_file = user_arguments.vcf_file[:-3] + "vep.filtered.vcf"
+    vcf_file = user_arguments.vcf_file
+    output_file = user_arguments.output_file
+    if not output_file:
+        if vcf_file == "-":
+            output_file = "-"
+        elif user_arguments.sweep:
+            output_file = output_name(vcf_file, ".vep.sweep.tsv")
+        else:
+            output_file = output_name(vcf_file, ".vep.filtered.vcf")
+            if user_arguments.compress:
+                output_file += ".gz"
     vep = VEP(
-        user_arguments.vcf_file, output_file, user_arguments.vep_thresholds
+        vcf_file,
+        output_file,
+        user_arguments.vep_thresholds,
+        user_arguments.transcripts,
+        user_arguments.compression_threads,
+        user_arguments.compress,
+        user_arguments.expression,
     )
-    vep.filter_vep()
-    # Used during training and testing.
-    # vep.create_confusion_matrix()
+    if user_arguments.sweep:
+        vep.sweep_thresholds(user_arguments.sweep, output_file)
+        return
+    if user_arguments.threads > 1:
+        counts = vep.filter_regions(
+            vcf_file,
+            user_arguments.threads,
+            user_arguments.region_size,
+        )
+    else:
+        counts = vep.filter_vep()
+    if user_arguments.compress and output_file != "-":
+        try:
+            vep.index_output(user_arguments.index_format)
+        except RuntimeError as error:
+            sys.exit(str(error))
+    # Training and test data have Class labels, evaluate them in the same pass.
+    if counts:
+        vep.print_confusion_matrix(counts)
+        # The matrix is written next to the filtered vcf, or next to the input
+        # vcf file when the filtered vcf goes to standard output.
+        if output_file != "-":
+            vep.write_confusion_matrix(
+                counts, output_name(output_file, ".confusion.json")
+            )
+        elif vcf_file != "-":
+            vep.write_confusion_matrix(
+                counts, output_name(vcf_file, ".vep.confusion.json")
+            )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+# -----------------------------------------------------------------------------
+# GenomeScan internship repository.
+# Copyright (C) 2023 Jasper Boom
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Contact information: info@jboom.org.
+# -----------------------------------------------------------------------------
+
+
+# Imports:
+import numpy as np
+import operator
+import re
+from vcf_annotation import to_float
+
+
+class FilterExpression:
+    """
+    The FilterExpression class:
+        This class compiles a filter expression over annotation fields, for
+        example "CADD_PHRED > 17 and IMPACT in {HIGH, MODERATE}", into a
+        predicate. The expression is parsed once, the predicate takes a
+        dictionary with a string array per field and returns a boolean array
+        with one value per row, so a whole batch of variants is filtered with
+        numpy operations only.
+
+        The expression language supports:
+            FIELD > < >= <= == != VALUE = compare a field to a number, or
+                                          with == and != to a string.
+            FIELD in {VALUE, ...} = the field is one of the values.
+            FIELD not in {VALUE, ...} = the field is none of the values.
+            FIELD contains VALUE = one of the & separated elements of the
+                                   field is the value, for example a
+                                   consequence of a list of consequences.
+            FIELD is missing, FIELD is not missing = the field is empty.
+            and, or, not and parentheses to combine comparisons.
+        Values are numbers, words or quoted strings, words may start with a
+        digit like 5_prime_UTR_variant. A missing or non-numeric value never
+        satisfies a numeric comparison.
+
+        This function creates a number of class attributes:
+            token_pattern = a compiled regular expression that splits an
+                            expression into tokens.
+            comparisons = a dictionary with the numpy function of each
+                          comparison operator.
+            keywords = a list of strings with the reserved words.
+    """
+
+    token_pattern = re.compile(
+        r"""\s*(?:
+            (?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w.-]))
+            |(?P<string>"[^"]*"|'[^']*')
+            |(?P<operator>>=|<=|==|!=|>|<|[{}(),])
+            |(?P<word>\w[\w.-]*)
+        )""",
+        re.VERBOSE,
+    )
+    comparisons = {
+        ">": operator.gt,
+        "<": operator.lt,
+        ">=": operator.ge,
+        "<=": operator.le,
+        "==": operator.eq,
+        "!=": operator.ne,
+    }
+    keywords = ["and", "or", "not", "in", "contains", "is", "missing"]
+
+    def __init__(self, expression):
+        """
+        The initializer function:
+            This function creates a number of instance attributes:
+                expression = the filter expression as a string.
+                fields = a list of strings with the names of the fields that
+                         the expression uses, in order of appearance.
+                predicate = the compiled function that evaluates the
+                            expression on a dictionary of string arrays.
+        """
+        self.expression = expression
+        self.fields = []
+        self.tokens = self.tokenize(expression)
+        self.position = 0
+        predicate = self.parse_or()
+        if self.position < len(self.tokens):
+            self.error("unexpected " + repr(self.tokens[self.position][1]))
+
+        def evaluate(columns):
+            return predicate(columns, {})
+
+        self.predicate = evaluate
+
+    def __call__(self, columns):
+        """
+        The call function:
+            This function evaluates the compiled expression on a dictionary
+            with a string array per field and returns a boolean array.
+        """
+        return self.predicate(columns)
+
+    def error(self, message):
+        """
+        The error function:
+            This function raises a ValueError that names the expression.
+        """
+        raise ValueError(
+            f"Invalid filter expression {self.expression!r}: {message}."
+        )
+
+    def tokenize(self, expression):
+        """
+        The tokenize function:
+            This function splits the expression into a list of tuples with
+            the kind and the text of each token.
+        """
+        tokens = []
+        position = 0
+        expression = expression.rstrip()
+        while position < len(expression):
+            match = self.token_pattern.match(expression, position)
+            if not match or match.end() == position:
+                self.error("cannot read " + repr(expression[position:]))
+            kind = match.lastgroup
+            text = match.group(kind)
+            if kind == "string":
+                text = text[1:-1]
+            elif kind == "word" and text.lower() in self.keywords:
+                kind = "keyword"
+                text = text.lower()
+            tokens.append((kind, text))
+            position = match.end()
+        return tokens
+
+    def peek(self, *texts):
+        """
+        The peek function:
+            This function checks if the next token is an operator or keyword
+            with one of the given texts.
+        """
+        if self.position >= len(self.tokens):
+            return False
+        kind, text = self.tokens[self.position]
+        return kind in ["operator", "keyword"] and text in texts
+
+    def take(self, *kinds):
+        """
+        The take function:
+            This function returns the text of the next token, which has to be
+            one of the given kinds.
+        """
+        if self.position >= len(self.tokens):
+            self.error("unexpected end")
+        kind, text = self.tokens[self.position]
+        if kind not in kinds:
+            self.error("unexpected " + repr(text))
+        self.position += 1
+        return text
+
+    def expect(self, text):
+        """
+        The expect function:
+            This function skips the next token, which has to be the given
+            operator or keyword.
+        """
+        if not self.peek(text):
+            self.error("expected " + repr(text))
+        self.position += 1
+
+    def parse_or(self):
+        """
+        The parse_or function:
+            This function parses comparisons joined by or.
+        """
+        terms = [self.parse_and()]
+        while self.peek("or"):
+            self.position += 1
+            terms.append(self.parse_and())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda columns, cache: np.logical_or.reduce(
+            [term(columns, cache) for term in terms]
+        )
+
+    def parse_and(self):
+        """
+        The parse_and function:
+            This function parses comparisons joined by and.
+        """
+        terms = [self.parse_not()]
+        while self.peek("and"):
+            self.position += 1
+            terms.append(self.parse_not())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda columns, cache: np.logical_and.reduce(
+            [term(columns, cache) for term in terms]
+        )
+
+    def parse_not(self):
+        """
+        The parse_not function:
+            This function parses a negated comparison, a comparison or an
+            expression in between parentheses.
+        """
+        if self.peek("not"):
+            self.position += 1
+            term = self.parse_not()
+            return lambda columns, cache: ~term(columns, cache)
+        if self.peek("("):
+            self.position += 1
+            term = self.parse_or()
+            self.expect(")")
+            return term
+        return self.parse_comparison()
+
+    def parse_value(self):
+        """
+        The parse_value function:
+            This function returns the next value as a float if it is a number,
+            otherwise as a string.
+        """
+        if self.position < len(self.tokens):
+            if self.tokens[self.position][0] == "number":
+                return float(self.take("number"))
+        return self.take("string", "word")
+
+    def parse_comparison(self):
+        """
+        The parse_comparison function:
+            This function parses a single comparison of a field and returns
+            the function that evaluates it on a batch.
+        """
+        field = self.take("word")
+        if field not in self.fields:
+            self.fields.append(field)
+        if self.peek("is"):
+            self.position += 1
+            negate = self.peek("not")
+            if negate:
+                self.position += 1
+            self.expect("missing")
+            return lambda columns, cache: (columns[field] == "") != negate
+        if self.peek("in", "not"):
+            negate = self.peek("not")
+            if negate:
+                self.position += 1
+            self.expect("in")
+            self.expect("{")
+            values = [str(self.parse_text())]
+            while self.peek(","):
+                self.position += 1
+                values.append(str(self.parse_text()))
+            self.expect("}")
+            return lambda columns, cache: (
+                np.isin(columns[field], values) != negate
+            )
+        if self.peek("contains"):
+            self.position += 1
+            element = "&" + str(self.parse_text()) + "&"
+            return lambda columns, cache: (
+                np.char.find(
+                    np.char.add(np.char.add("&", columns[field]), "&"), element
+                )
+                >= 0
+            )
+        comparison = self.comparisons.get(self.take("operator"))
+        if comparison is None:
+            self.position -= 1
+            self.error("unexpected " + repr(self.tokens[self.position][1]))
+        value = self.parse_value()
+        if isinstance(value, float):
+
+            def compare_number(columns, cache):
+                if field not in cache:
+                    cache[field] = to_float(columns[field])
+                values = cache[field]
+                return comparison(values, value) & ~np.isnan(values)
+
+            return compare_number
+        if comparison not in [operator.eq, operator.ne]:
+            self.error(f"{field} can only be compared to a number")
+        return lambda columns, cache: comparison(columns[field], value)
+
+    def parse_text(self):
+        """
+        The parse_text function:
+            This function returns the next value as it is written, so numbers
+            in a set are compared as strings.
+        """
+        return self.take("number", "string", "word")
+
+
+# Additional information:
+# =======================
+#
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# -----------------------------------------------------------------------------
+# GenomeScan internship repository.
+# Copyright (C) 2023 Jasper Boom
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Contact information: info@jboom.org.
+# -----------------------------------------------------------------------------
+
+# Imports:
+import csv
+import numpy as np
+import os
+import sys
+
+
+class Phen2GeneTable:
+    """
+    The Phen2GeneTable class:
+        This class compiles the ranked gene list from phen2gene into a compact
+        gene to rank lookup table. The table consists of the interned gene
+        symbols and an integer array with their ranks, and is saved next to the
+        phen2gene file so it only has to be compiled once. Genes that are not
+        in the phen2gene list get the highest (worst) rank in the list.
+
+        This function creates a number of class attributes:
+            extension = the extension that is added to the phen2gene file name
+                        for the compiled table.
+    """
+
+    extension = ".ranks.npz"
+
+    def __init__(self, phen2gene_file):
+        """
+        The initializer function:
+            This function creates a number of instance attributes:
+                phen2gene_file = the phen2gene ranked gene file.
+                compiled_file = the full path to the compiled table.
+                genes = a list of interned gene symbols.
+                ranks = an integer array with the rank of each gene.
+                max_rank = the highest rank in the phen2gene list.
+                lookup = a dictionary with gene symbols as keys and ranks
+                         as values.
+        """
+        self.phen2gene_file = phen2gene_file
+        self.compiled_file = phen2gene_file + self.extension
+        if os.path.exists(self.compiled_file) and os.path.getmtime(
+            self.compiled_file
+        ) >= os.path.getmtime(self.phen2gene_file):
+            self.load()
+        else:
+            self.compile()
+            self.save()
+        self.max_rank = int(self.ranks.max())
+        self.lookup = dict(zip(self.genes, self.ranks.tolist()))
+
+    def compile(self):
+        """
+        The compile function:
+            This function reads the tab separated phen2gene file and collects
+            the gene symbols and ranks. If a gene occurs more than once, the
+            first (best) rank is kept.
+        """
+        genes = {}
+        with open(self.phen2gene_file, "r") as file:
+            for row in csv.DictReader(file, delimiter="\t"):
+                if row["Gene"] not in genes:
+                    genes[sys.intern(row["Gene"])] = int(row["Rank"])
+        self.genes = list(genes)
+        self.ranks = np.array(list(genes.values()), dtype=np.int32)
+
+    def save(self):
+        """
+        The save function:
+            This function writes the compiled table next to the phen2gene file.
+            The table is first written under a temporary name of this process,
+            so an interrupted or concurrent run never leaves a partial table
+            behind. If that location is not writable, the table is only kept in
+            memory.
+        """
+        temp_file = self.compiled_file + f".{os.getpid()}.tmp"
+        try:
+            with open(temp_file, "wb") as file_out:
+                np.savez(file_out, genes=np.array(self.genes), ranks=self.ranks)
+            os.replace(temp_file, self.compiled_file)
+        except OSError:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    def load(self):
+        """
+        The load function:
+            This function reads the compiled table from disk.
+        """
+        with np.load(self.compiled_file) as compiled:
+            self.genes = [sys.intern(str(gene)) for gene in compiled["genes"]]
+            self.ranks = compiled["ranks"]
+
+    def rank(self, gene):
+        """
+        The rank function:
+            This function returns the phen2gene rank of a single gene.
+        """
+        return self.lookup.get(gene, self.max_rank)
+
+    def rank_array(self, genes):
+        """
+        The rank_array function:
+            This function returns the phen2gene ranks of a list of genes as a
+            float array.
+        """
+        return np.fromiter(
+            (self.lookup.get(gene, self.max_rank) for gene in genes),
+            dtype=float,
+            count=len(genes),
+        )
+
+
+# Additional information:
+# =======================
+#
@@ -23,11 +23,26 @@
 # Imports:
 import argparse
 import datetime
+import json
 import numpy
 import os
 import subprocess
 import sys
+import tempfile
 import yaml
+from cyvcf2 import VCF
+from slurm_jobs import JobMonitor, LocalExecutor
+from vcf_annotation import AnnotationParser
+
+
+def priority_score_range(start=0.01, stop=1.0, step=0.01):
+    """
+    The priority_score_range function:
+        This function creates a list of minimal priority scores from start up
+        to and including stop, rounded to two decimals.
+    """
+    steps = int(round((stop - start) / step))
+    return [round(start + index * step, 2) for index in range(steps + 1)]
 
 
 class Variants:
@@ -173,6 +188,8 @@ class Exomiser:
                               arguments to execute on the computer cluster.
             log_file_exomiser_slurm: a string with the full path to the file
                                      used by slurm to write logs to.
+            modes: a list of strings with the exomiser analysis modes that are
+                   run for every minimal priority score.
     """
 
     minimal_priority_score = []
@@ -181,6 +198,7 @@ class Exomiser:
     yaml_file = ""
     exomiser_command = ""
     log_file_exomiser_slurm = ""
+    modes = ["PASS_ONLY", "FULL"]
 
     def __init__(
         self,
@@ -193,6 +211,7 @@ class Exomiser:
         vcf_file,
         config_file,
         log_folder,
+        monitor=None,
     ):
         """
         The initializer function:
@@ -215,6 +234,9 @@ class Exomiser:
                              file.
                 log_folder: a string with the full path to the folder to use as
                             storage for the log files.
+                monitor: a JobMonitor that submits the sbatch jobs and records
+                         their job ids, or a LocalExecutor that runs them on
+                         this computer.
         """
         self.yaml_dictionary = yaml_dictionary
         self.exomiser_output_path = exomiser_output_path
@@ -225,6 +247,7 @@ class Exomiser:
         self.vcf_file = vcf_file
         self.config_file = config_file
         self.log_folder = log_folder
+        self.monitor = monitor
 
     def minimal_priority_range(self):
         """
@@ -232,10 +255,7 @@ class Exomiser:
             This function creates a range of floats that will be tested as
             minimal priority scores in the exomiser settings.
         """
-        for i in numpy.arange(0.01, 1.0, 0.01):
-            self.minimal_priority_score.append(float("%.2f" % i))
-        self.minimal_priority_score[0] = 0.01
-        self.minimal_priority_score.append(1.0)
+        self.minimal_priority_score.extend(priority_score_range())
 
     def yaml_to_file(self):
         """
@@ -289,16 +309,16 @@ class Exomiser:
             system. All requirements are filled, like a job name, log/error
             locations and resource requirements. The wrap argument is used to
             execute a cli tool, for which slurm will automatically create a
-            simple bash script.
+            simple bash script. The job is submitted by the monitor, which
+            records its job id.
         """
         slurm_name = "exomiser_" + self.exomiser_output_name + "_" + str(score)
         log_directory = self.log_folder + "/" + mode
         self.log_file_exomiser_slurm = log_directory + "/" + slurm_name + ".log"
         if not os.path.exists(log_directory):
             os.makedirs(log_directory)
-        process = subprocess.Popen(
+        self.monitor.submit(
             [
-                "sbatch",
                 "--job-name=" + slurm_name,
                 "--error=" + log_directory + "/" + slurm_name + ".error",
                 "--output=" + self.log_file_exomiser_slurm,
@@ -307,12 +327,9 @@ class Exomiser:
                 "--export=ALL",
                 "--partition=all",
                 "--wrap=" + self.exomiser_command,
-            ]
+            ],
+            [mode + "/" + str(score)],
         )
-        output, errors = process.communicate()
-        if not os.path.exists(self.log_file_exomiser_slurm):
-            with open(self.log_file_exomiser_slurm, "w"):
-                pass
 
     def run_exomiser(self):
         """
@@ -324,38 +341,590 @@ class Exomiser:
             or PASS ONLY mode.
         """
         self.minimal_priority_range()
-        for mode in ["PASS_ONLY", "FULL"]:
-            self.yaml_dictionary["analysis"]["analysisMode"] = mode
+        for mode in self.modes:
             for score in self.minimal_priority_score:
-                self.yaml_dictionary["analysis"]["steps"][3][
-                    "priorityScoreFilter"
-                ]["minPriorityScore"] = score
-                self.yaml_dictionary["outputOptions"]["outputDirectory"] = (
-                    self.exomiser_output_path
-                    + "/"
-                    + self.yaml_dictionary["analysis"]["analysisMode"]
-                    + "/"
-                    + str(score)
-                )
-                if not os.path.exists(
-                    self.yaml_dictionary["outputOptions"]["outputDirectory"]
+                self.run_score(mode, score)
+
+    def run_score(self, mode, score):
+        """
+        The run_score function:
+            This function updates the exomiser options with a mode and minimal
+            priority score, writes them to a yaml file in the output folder of
+            that score and submits the exomiser run.
+        """
+        self.yaml_dictionary["analysis"]["analysisMode"] = mode
+        self.yaml_dictionary["analysis"]["steps"][3]["priorityScoreFilter"][
+            "minPriorityScore"
+        ] = score
+        self.yaml_dictionary["outputOptions"]["outputDirectory"] = (
+            self.exomiser_output_path + "/" + mode + "/" + str(score)
+        )
+        if not os.path.exists(
+            self.yaml_dictionary["outputOptions"]["outputDirectory"]
+        ):
+            os.makedirs(
+                self.yaml_dictionary["outputOptions"]["outputDirectory"]
+            )
+        self.yaml_to_file()
+        self.singularity()
+        self.sbatch(score, mode)
+        self.exomiser_log_files.append(self.log_file_exomiser_slurm)
+        self.exomiser_result_files.append(
+            str(
+                self.yaml_dictionary["outputOptions"]["outputDirectory"]
+                + "/"
+                + self.yaml_dictionary["outputOptions"]["outputFileName"]
+            )
+        )
+
+    def result_vcf(self, mode, score):
+        """
+        The result_vcf function:
+            This function returns the full path to the vcf file of exomiser
+            for a mode and minimal priority score.
+        """
+        return (
+            self.exomiser_output_path
+            + "/"
+            + mode
+            + "/"
+            + str(score)
+            + "/"
+            + self.exomiser_output_name
+            + ".vcf.gz"
+        )
+
+    def confusion_matrix(self, score):
+        """
+        The confusion_matrix function:
+            This function counts the true negatives, false negatives, false
+            positives and true positives of a minimal priority score, in the
+            same way as collect-exomiser-files.py and analyse-exomiser-files.py:
+            a variant of the FULL run is predicted pathogenic if its id is in
+            the PASS_ONLY run. None is returned if a run has no vcf file or if
+            a vcf file cannot be read, for example because it is truncated.
+        """
+        pass_only_vcf = self.result_vcf("PASS_ONLY", score)
+        full_vcf = self.result_vcf("FULL", score)
+        if not os.path.exists(pass_only_vcf) or not os.path.exists(full_vcf):
+            return None
+        try:
+            return self.count_matrix(pass_only_vcf, full_vcf)
+        except (OSError, ValueError) as error:
+            print(
+                f"Cannot read the exomiser results of {score}: {error}",
+                file=sys.stderr,
+            )
+            return None
+
+    def count_matrix(self, pass_only_vcf, full_vcf):
+        """
+        The count_matrix function:
+            This function reads the vcf files of the PASS_ONLY and FULL runs
+            of a minimal priority score and returns the confusion matrix.
+        """
+        pass_only_ids = set()
+        vcf = VCF(pass_only_vcf)
+        id_extractor = AnnotationParser(vcf).exomiser_extractor(["ID"])
+        for variant in vcf:
+            pass_only_ids.add(
+                id_extractor(variant.INFO.get("Exomiser", "N/A"))[0]
+            )
+        matrix = {"TN": 0, "FN": 0, "FP": 0, "TP": 0}
+        vcf = VCF(full_vcf)
+        id_extractor = AnnotationParser(vcf).exomiser_extractor(["ID"])
+        for variant in vcf:
+            known_class = variant.INFO.get("Class", "N/A")
+            predicted = (
+                id_extractor(variant.INFO.get("Exomiser", "N/A"))[0]
+                in pass_only_ids
+            )
+            if known_class == "Pathogenic":
+                matrix["TP" if predicted else "FN"] += 1
+            elif known_class == "Benign":
+                matrix["FP" if predicted else "TN"] += 1
+        return [matrix["TN"], matrix["FN"], matrix["FP"], matrix["TP"]]
+
+    def youden_j(self, matrix):
+        """
+        The youden_j function:
+            This function calculates the true positive rate, false positive
+            rate and Youden's J (TPR - FPR) of a confusion matrix, like
+            ReceiverOperatorCurve in analyse-exomiser-files.py.
+        """
+        tn, fn, fp, tp = matrix
+        tpr = 0.0 if tp + fn == 0 else tp / (tp + fn)
+        fpr = 0.0 if fp + tn == 0 else fp / (fp + tn)
+        return tpr, fpr, tpr - fpr
+
+    def evaluate_scores(self, scores, results):
+        """
+        The evaluate_scores function:
+            This function runs exomiser in both modes for a list of minimal
+            priority scores, waits until all runs are done and adds the
+            confusion matrix of every score to the results dictionary, None
+            for scores of which a run failed. The vcf files of an earlier run
+            are removed first, so they are never mistaken for new results.
+        """
+        for score in scores:
+            self.minimal_priority_score.append(score)
+            for mode in self.modes:
+                if os.path.exists(self.result_vcf(mode, score)):
+                    os.remove(self.result_vcf(mode, score))
+                self.run_score(mode, score)
+        failed = self.monitor.wait()
+        for score in scores:
+            if any(mode + "/" + str(score) in failed for mode in self.modes):
+                results[score] = None
+            else:
+                results[score] = self.confusion_matrix(score)
+
+    def run_adaptive(self, coarse_step=0.1, fine_step=0.01):
+        """
+        The run_adaptive function:
+            This function searches the minimal priority score with the highest
+            Youden's J. First a coarse grid of scores is run. Then the scores
+            in between the best coarse score and its neighbours are run one
+            fine step at a time, both up and down. A direction stops as soon
+            as J does not improve anymore. The results are written to an
+            .adaptive.tsv file and the best score is returned.
+        """
+        results = {}
+        self.evaluate_scores(
+            priority_score_range(coarse_step, 1.0, coarse_step), results
+        )
+        best = self.best_score(results)
+        if best is None:
+            raise RuntimeError("None of the coarse exomiser runs completed.")
+        directions = {1: best, -1: best}
+        step = 1
+        while directions and step * fine_step < coarse_step - 1e-9:
+            scores = {
+                direction: round(best + direction * step * fine_step, 2)
+                for direction in directions
+            }
+            for direction, score in list(scores.items()):
+                if not 0.0 < score <= 1.0 or score in results:
+                    del directions[direction]
+                    del scores[direction]
+            self.evaluate_scores(list(scores.values()), results)
+            for direction, score in scores.items():
+                previous = results[directions[direction]]
+                if (
+                    results[score] is None
+                    or self.youden_j(results[score])[2]
+                    <= self.youden_j(previous)[2]
                 ):
-                    os.makedirs(
-                        self.yaml_dictionary["outputOptions"]["outputDirectory"]
+                    del directions[direction]
+                else:
+                    directions[direction] = score
+            step += 1
+        best = self.best_score(results)
+        self.write_adaptive_results(results)
+        print("The optimal minimal priority score = " + str(best))
+        print(
+            "The number of tested minimal priority scores = "
+            + str(len(results))
+        )
+        return best
+
+    def best_score(self, results):
+        """
+        The best_score function:
+            This function returns the minimal priority score with the highest
+            Youden's J, the lowest score wins a tie, like in
+            analyse-exomiser-files.py. None is returned without results.
+        """
+        scores = [score for score in sorted(results) if results[score]]
+        if not scores:
+            return None
+        youden_j = [self.youden_j(results[score])[2] for score in scores]
+        return scores[int(numpy.argmax(youden_j))]
+
+    def write_adaptive_results(self, results):
+        """
+        The write_adaptive_results function:
+            This function writes the confusion matrix, TPR, FPR and Youden's J
+            of every tested minimal priority score to a tsv file.
+        """
+        with open(
+            self.exomiser_output_path
+            + "/"
+            + self.exomiser_output_name
+            + ".adaptive.tsv",
+            "w",
+        ) as file_out:
+            file_out.write(
+                "\t".join(
+                    [
+                        "MINIMAL_PRIORITY_SCORE",
+                        "TN",
+                        "FN",
+                        "FP",
+                        "TP",
+                        "TPR",
+                        "FPR",
+                        "YOUDEN_J",
+                    ]
+                )
+                + "\n"
+            )
+            for score in sorted(results):
+                if not results[score]:
+                    continue
+                file_out.write(
+                    "\t".join(
+                        map(
+                            str,
+                            [f"{score:.2f}"]
+                            + results[score]
+                            + list(self.youden_j(results[score])),
+                        )
                     )
-                self.yaml_to_file()
-                self.singularity()
-                self.sbatch(score, mode)
-                self.exomiser_log_files.append(self.log_file_exomiser_slurm)
+                    + "\n"
+                )
+
+    def write_manifest(self):
+        """
+        The write_manifest function:
+            This function creates the output folder of every minimal priority
+            score in each exomiser mode and writes a single json manifest
+            with the exomiser options, the settings of this object and one
+            task (mode, minimal priority score and output folder) per job
+            array index. The name of the manifest and a list with a label
+            (mode/score) per task are returned.
+        """
+        tasks = []
+        for mode in self.modes:
+            for score in self.minimal_priority_score:
+                output_directory = (
+                    self.exomiser_output_path + "/" + mode + "/" + str(score)
+                )
+                if not os.path.exists(output_directory):
+                    os.makedirs(output_directory)
+                tasks.append(
+                    {
+                        "mode": mode,
+                        "score": score,
+                        "output_directory": output_directory,
+                    }
+                )
                 self.exomiser_result_files.append(
-                    str(
-                        self.yaml_dictionary["outputOptions"]["outputDirectory"]
-                        + "/"
-                        + self.yaml_dictionary["outputOptions"][
-                            "outputFileName"
-                        ]
-                    )
+                    output_directory
+                    + "/"
+                    + self.yaml_dictionary["outputOptions"]["outputFileName"]
                 )
+        manifest_file = (
+            self.exomiser_output_path
+            + "/"
+            + self.exomiser_output_name
+            + ".manifest.json"
+        )
+        with open(manifest_file, "w") as file:
+            json.dump(
+                {
+                    "settings": {
+                        "exomiser_output_path": self.exomiser_output_path,
+                        "exomiser_output_name": self.exomiser_output_name,
+                        "docker_container": self.docker_container,
+                        "temp_folder": self.temp_folder,
+                        "exomiser_jar": self.exomiser_jar,
+                        "vcf_file": self.vcf_file,
+                        "config_file": self.config_file,
+                        "log_folder": self.log_folder,
+                    },
+                    "yaml_dictionary": self.yaml_dictionary,
+                    "tasks": tasks,
+                },
+                file,
+                indent=4,
+            )
+        return manifest_file, [
+            task["mode"] + "/" + str(task["score"]) for task in tasks
+        ]
+
+    def sbatch_array(self, manifest_file, labels, throttle):
+        """
+        The sbatch_array function:
+            This function submits a single sbatch job array with one task per
+            entry in the manifest, of which at most throttle tasks run at the
+            same time. Every task calls this script with --task, which picks
+            the task of its array index from the manifest. The logs of a task
+            are named after the array index. The monitor records the job id of
+            every task.
+        """
+        slurm_name = "exomiser_" + self.exomiser_output_name
+        log_directory = self.log_folder + "/ARRAY"
+        self.log_file_exomiser_slurm = (
+            log_directory + "/" + slurm_name + "_%a.log"
+        )
+        if not os.path.exists(log_directory):
+            os.makedirs(log_directory)
+        self.monitor.submit(
+            [
+                "--job-name=" + slurm_name,
+                "--array=0-" + str(len(labels) - 1) + "%" + str(throttle),
+                "--error=" + log_directory + "/" + slurm_name + "_%a.error",
+                "--output=" + self.log_file_exomiser_slurm,
+                "--cpus-per-task=3",
+                "--mem=80G",
+                "--export=ALL",
+                "--partition=all",
+                "--wrap=python3 "
+                + os.path.abspath(__file__)
+                + " --task "
+                + manifest_file,
+            ],
+            labels,
+        )
+
+    def run_exomiser_array(self, throttle):
+        """
+        The run_exomiser_array function:
+            This function runs exomiser for the range of minimal priority
+            scores in both modes as one slurm job array, instead of one sbatch
+            script and yaml file per score and mode.
+        """
+        self.minimal_priority_range()
+        manifest_file, labels = self.write_manifest()
+        self.sbatch_array(manifest_file, labels, throttle)
+        self.exomiser_log_files.append(self.log_file_exomiser_slurm)
+
+    def run_task(self, task):
+        """
+        The run_task function:
+            This function runs exomiser for a single task of the manifest. The
+            exomiser options of the task are written to a temporary yaml file,
+            which is removed when exomiser is done. The exit code of exomiser
+            is returned.
+        """
+        self.yaml_dictionary["analysis"]["analysisMode"] = task["mode"]
+        self.yaml_dictionary["analysis"]["steps"][3]["priorityScoreFilter"][
+            "minPriorityScore"
+        ] = task["score"]
+        self.yaml_dictionary["outputOptions"]["outputDirectory"] = task[
+            "output_directory"
+        ]
+        handle, self.yaml_file = tempfile.mkstemp(
+            suffix=".yml", dir=self.temp_folder
+        )
+        try:
+            with os.fdopen(handle, "w") as file:
+                yaml.dump(self.yaml_dictionary, file)
+            self.singularity()
+            return subprocess.run(self.exomiser_command, shell=True).returncode
+        finally:
+            os.remove(self.yaml_file)
+
+    def run_sweep(self):
+        """
+        The run_sweep function:
+            This function starts a single sbatch script that runs exomiser in
+            FULL mode with a minimal priority score of 0, which disables the
+            priority score filter, and with a gene tsv file next to the vcf
+            file. When exomiser is done, the same job calls this script with
+            --derive to create the results of every minimal priority score
+            from the vcf and gene tsv files of that run.
+        """
+        self.minimal_priority_range()
+        self.yaml_dictionary["analysis"]["analysisMode"] = "FULL"
+        output_formats = self.yaml_dictionary["outputOptions"]["outputFormats"]
+        if "TSV_GENE" not in output_formats:
+            output_formats.append("TSV_GENE")
+        self.yaml_dictionary["analysis"]["steps"][3]["priorityScoreFilter"][
+            "minPriorityScore"
+        ] = 0.0
+        self.yaml_dictionary["outputOptions"]["outputDirectory"] = (
+            self.exomiser_output_path + "/SWEEP"
+        )
+        if not os.path.exists(
+            self.yaml_dictionary["outputOptions"]["outputDirectory"]
+        ):
+            os.makedirs(
+                self.yaml_dictionary["outputOptions"]["outputDirectory"]
+            )
+        self.yaml_to_file()
+        self.singularity()
+        result_file = (
+            self.yaml_dictionary["outputOptions"]["outputDirectory"]
+            + "/"
+            + self.yaml_dictionary["outputOptions"]["outputFileName"]
+        )
+        self.exomiser_command += (" ").join(
+            [
+                " &&",
+                "python3",
+                os.path.abspath(__file__),
+                "--derive",
+                result_file + ".vcf.gz",
+                "--output",
+                self.exomiser_output_path,
+            ]
+        )
+        self.sbatch("sweep", "SWEEP")
+        self.exomiser_log_files.append(self.log_file_exomiser_slurm)
+        self.exomiser_result_files.append(result_file)
+
+
+class ThresholdSweep:
+    """
+    The ThresholdSweep class:
+        This class derives the exomiser results of a range of minimal priority
+        scores from a single vcf file of exomiser in FULL mode, created
+        without priority score filter. A variant passes at a minimal priority
+        score if it passes all other filters and the HiPhive score of its
+        gene is at least that score. The HiPhive score is read from the gene
+        tsv file of the same run, because the EXOMISER_GENE_PHENO_SCORE in
+        the vcf file also includes the OMIM prioritiser that runs after the
+        priority score filter. For every minimal priority score a PASS_ONLY
+        and a FULL tsv file are written, in the same layout as
+        collect-exomiser-files.py, so analyse-exomiser-files.py can use them
+        directly.
+
+        This function creates a number of class attributes:
+            priority_field = the gene tsv column with the HiPhive score that
+                             the priority score filter uses.
+            gene_field = the exomiser annotation field and gene tsv column
+                         that links a variant to its gene.
+            acmg_fields = a list of the exomiser annotation fields that are
+                          replaced by UNKNOWN in the tsv files.
+    """
+
+    priority_field = "PHIVE_ALL_SPECIES_SCORE"
+    gene_field = "ENTREZ_GENE_ID"
+    acmg_fields = [
+        "EXOMISER_ACMG_CLASSIFICATION",
+        "EXOMISER_ACMG_EVIDENCE",
+        "EXOMISER_ACMG_DISEASE_ID",
+        "EXOMISER_ACMG_DISEASE_NAME",
+    ]
+
+    def __init__(self, vcf_file, minimal_priority_scores, results_directory):
+        """
+        The initializer function:
+            This function creates a number of instance attributes:
+                vcf_file = a string with the full path to the vcf file of the
+                           FULL exomiser run without priority score filter.
+                gene_file = a string with the full path to the gene tsv file
+                            of the same run.
+                minimal_priority_scores = a list of floats to derive the
+                                          results for.
+                results_directory = a string with the full path to the folder
+                                    to write the tsv files to.
+        """
+        self.vcf_file = vcf_file
+        self.gene_file = vcf_file.removesuffix(".vcf.gz") + ".genes.tsv"
+        self.minimal_priority_scores = minimal_priority_scores
+        self.results_directory = results_directory
+
+    def read_gene_scores(self):
+        """
+        The read_gene_scores function:
+            This function reads the gene tsv file and returns a dictionary with
+            the HiPhive score of every gene. A gene has a line for every mode
+            of inheritance, the highest score is used.
+        """
+        gene_scores = {}
+        with open(self.gene_file, "r") as file:
+            header = file.readline().lstrip("#").rstrip("\n").split("\t")
+            gene_index = header.index(self.gene_field)
+            priority_index = header.index(self.priority_field)
+            for line in file:
+                values = line.rstrip("\n").split("\t")
+                gene_scores[values[gene_index]] = max(
+                    float(values[priority_index]),
+                    gene_scores.get(values[gene_index], 0.0),
+                )
+        return gene_scores
+
+    def read_variants(self):
+        """
+        The read_variants function:
+            This function reads the vcf file once. It returns the tsv lines of
+            all variants without the predicted class, a boolean array that is
+            True for the variants that passed all filters and an array with
+            the priority score of the gene of each variant, which is NaN for
+            genes without a score.
+        """
+        gene_scores = self.read_gene_scores()
+        vcf = VCF(self.vcf_file)
+        exomiser_fields = AnnotationParser.exomiser_annotation
+        exomiser_extractor = AnnotationParser(vcf).exomiser_extractor(
+            exomiser_fields
+        )
+        acmg_indices = [
+            exomiser_fields.index(field) for field in self.acmg_fields
+        ]
+        gene_index = exomiser_fields.index(self.gene_field)
+        lines = []
+        passed = []
+        scores = []
+        for variant in vcf:
+            exomiser_info = list(
+                exomiser_extractor(variant.INFO.get("Exomiser", "N/A"))
+            )
+            scores.append(gene_scores.get(exomiser_info[gene_index], numpy.nan))
+            for index in acmg_indices:
+                exomiser_info[index] = "UNKNOWN"
+            lines.append(
+                "\t".join(exomiser_info + [variant.INFO.get("Class", "N/A")])
+            )
+            passed.append(variant.FILTER is None)
+        return (
+            lines,
+            numpy.array(passed, dtype=bool),
+            numpy.array(scores, dtype=float),
+        )
+
+    def write_tsv_files(self):
+        """
+        The write_tsv_files function:
+            This function classifies all variants for every minimal priority
+            score at once and writes a PASS_ONLY and a FULL tsv file for each
+            score. Variants without a priority score never pass.
+        """
+        lines, passed, scores = self.read_variants()
+        thresholds = numpy.array(self.minimal_priority_scores, dtype=float)
+        with numpy.errstate(invalid="ignore"):
+            passing = passed[:, numpy.newaxis] & (
+                scores[:, numpy.newaxis] >= thresholds
+            )
+        header = (
+            "\t".join(
+                AnnotationParser.exomiser_annotation
+                + ["KNOWN_CLASS", "PREDICTED_CLASS"]
+            )
+            + "\n"
+        )
+        for index, score in enumerate(self.minimal_priority_scores):
+            predicted = passing[:, index].tolist()
+            for mode in ["PASS_ONLY", "FULL"]:
+                output_file = (
+                    self.results_directory + "/" + mode + f"_{score:.2f}.tsv"
+                )
+                with open(output_file, "w") as file_out:
+                    file_out.write(header)
+                    for line, pathogenic in zip(lines, predicted):
+                        if mode == "PASS_ONLY" and not pathogenic:
+                            continue
+                        file_out.write(
+                            line
+                            + ("\tPathogenic\n" if pathogenic else "\tBenign\n")
+                        )
+
+
+def run_array_task(manifest_file, task_id):
+    """
+    The run_array_task function:
+        This function is the entry point of a task of the slurm job array. It
+        reads the manifest, recreates the Exomiser object and runs the task of
+        the array index. The exit code of exomiser is returned, so slurm
+        records failed tasks.
+    """
+    with open(manifest_file, "r") as file:
+        manifest = json.load(file)
+    exomiser = Exomiser(manifest["yaml_dictionary"], **manifest["settings"])
+    return exomiser.run_task(manifest["tasks"][task_id])
 
 
 def parse_argvs():
@@ -367,7 +936,8 @@ def parse_argvs():
     description = "This script executes exomiser on a trainingset. It changes\
                    the minimal priority score for each run and organises the\
                    output in a folder structure."
-    epilog = "This python script has two dependencies: numpy & pyyaml"
+    epilog = "This python script has three dependencies: cyvcf2, numpy &\
+              pyyaml."
     parser = argparse.ArgumentParser(
         description=description,
         epilog=epilog,
@@ -472,10 +1042,201 @@ def parse_argvs():
         help="instead of running exomiser, just update the input vcf with\
               correct class information.",
     )
+    parser.add_argument(
+        "-s",
+        "--sweep",
+        action="store_true",
+        dest="sweep",
+        help="run exomiser once in FULL mode without priority score filter\
+              and derive the results of every minimal priority score from\
+              that run, instead of running exomiser for every score and mode.",
+    )
+    parser.add_argument(
+        "-r",
+        "--derive",
+        action="store",
+        dest="derive_vcf",
+        type=str,
+        default=None,
+        help="instead of running exomiser, write the tsv files of every\
+              minimal priority score to the output folder, derived from this\
+              exomiser vcf file of a sweep run and the .genes.tsv file next\
+              to it.",
+    )
+    parser.add_argument(
+        "-x",
+        "--executor",
+        action="store",
+        dest="executor",
+        type=str,
+        choices=["slurm", "slurm-array", "local"],
+        default="slurm",
+        help="how exomiser is run for every minimal priority score: one\
+              sbatch script per score and mode (slurm), a single slurm job\
+              array with a json manifest (slurm-array), or a pool of\
+              processes on this computer (local).",
+    )
+    parser.add_argument(
+        "-P",
+        "--max-parallel",
+        action="store",
+        dest="max_parallel",
+        type=int,
+        default=1,
+        help="the maximum number of exomiser runs at the same time with the\
+              local executor.",
+    )
+    parser.add_argument(
+        "-M",
+        "--max-memory",
+        action="store",
+        dest="max_memory",
+        type=int,
+        default=None,
+        help="the number of gigabytes of memory that the exomiser runs of the\
+              local executor may use together, a run is only started if its\
+              80 GB fit. By default the memory available at the start.",
+    )
+    parser.add_argument(
+        "-a",
+        "--array-throttle",
+        action="store",
+        dest="array_throttle",
+        type=int,
+        default=10,
+        help="the maximum number of tasks of the slurm job array that run at\
+              the same time.",
+    )
+    parser.add_argument(
+        "-k",
+        "--task",
+        action="store",
+        dest="task_manifest",
+        type=str,
+        default=None,
+        help="run a single task of a slurm job array from this manifest, the\
+              task is picked by the SLURM_ARRAY_TASK_ID variable or\
+              --task-id. Used by the job array itself.",
+    )
+    parser.add_argument(
+        "-i",
+        "--task-id",
+        action="store",
+        dest="task_id",
+        type=int,
+        default=None,
+        help="the index of the task to run with --task.",
+    )
+    parser.add_argument(
+        "-A",
+        "--adaptive",
+        action="store_true",
+        dest="adaptive",
+        help="search the minimal priority score with the highest Youden's J\
+              with a coarse grid that is refined around the best score,\
+              instead of running every score. Waits for the runs.",
+    )
+    parser.add_argument(
+        "--coarse-step",
+        action="store",
+        dest="coarse_step",
+        type=float,
+        default=0.1,
+        help="the step size of the coarse grid of the adaptive search, a\
+              multiple of 0.01.",
+    )
+    parser.add_argument(
+        "--fine-step",
+        action="store",
+        dest="fine_step",
+        type=float,
+        default=0.01,
+        help="the step size of the refinement of the adaptive search, a\
+              multiple of 0.01.",
+    )
+    parser.add_argument(
+        "-w",
+        "--wait",
+        action="store_true",
+        dest="wait",
+        help="after submitting, follow the jobs with squeue and sacct until\
+              all are done, resubmit tasks that ran out of memory or time and\
+              list the failed tasks.",
+    )
+    parser.add_argument(
+        "-m",
+        "--monitor",
+        action="store",
+        dest="jobs_file",
+        type=str,
+        default=None,
+        help="instead of submitting, follow the jobs recorded in this jobs\
+              file of an earlier run until all are done.",
+    )
+    parser.add_argument(
+        "--retries",
+        action="store",
+        dest="retries",
+        type=int,
+        default=2,
+        help="the number of times a task that ran out of memory or time is\
+              submitted again.",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        action="store",
+        dest="poll_interval",
+        type=int,
+        default=60,
+        help="the number of seconds between two checks of the slurm job\
+              states.",
+    )
+    parser.add_argument(
+        "--notify",
+        action="store",
+        dest="notify_command",
+        type=str,
+        default=None,
+        help="a shell command that is run with a summary on its standard\
+              input when all jobs are done, for example a mail command.",
+    )
+    parser.add_argument(
+        "--sbatch",
+        action="store",
+        dest="sbatch_command",
+        type=str,
+        default="sbatch",
+        help="the command used to submit jobs, for example\
+              'python3 fake-slurm.py sbatch' to test without slurm.",
+    )
+    parser.add_argument(
+        "--squeue",
+        action="store",
+        dest="squeue_command",
+        type=str,
+        default="squeue",
+        help="the command used to list active jobs.",
+    )
+    parser.add_argument(
+        "--sacct",
+        action="store",
+        dest="sacct_command",
+        type=str,
+        default="sacct",
+        help="the command used to list finished jobs.",
+    )
     parser.add_argument(
         "-v", "--version", action="version", version="%(prog)s [1.0]]"
     )
     argvs = parser.parse_args()
+    if argvs.adaptive and (argvs.sweep or argvs.executor == "slurm-array"):
+        parser.error("--adaptive runs every score with slurm or local.")
+    # The minimal priority scores are rounded to two decimals.
+    for step in [argvs.coarse_step, argvs.fine_step]:
+        if step < 0.01 or abs(round(step, 2) - step) > 1e-9:
+            parser.error(
+                "--coarse-step and --fine-step must be multiples of 0.01."
+            )
     return argvs
 
 
@@ -485,6 +1246,30 @@ def main():
         This function calls all processing functions in correct order.
     """
     user_arguments = parse_argvs()
+    monitor_settings = {
+        "retries": user_arguments.retries,
+        "poll_interval": user_arguments.poll_interval,
+        "sbatch_command": user_arguments.sbatch_command,
+        "squeue_command": user_arguments.squeue_command,
+        "sacct_command": user_arguments.sacct_command,
+    }
+    if user_arguments.jobs_file:
+        monitor = JobMonitor(
+            user_arguments.jobs_file, resume=True, **monitor_settings
+        )
+        sys.exit(1 if monitor.wait(user_arguments.notify_command) else 0)
+    if user_arguments.task_manifest:
+        task_id = user_arguments.task_id
+        if task_id is None:
+            task_id = int(os.environ["SLURM_ARRAY_TASK_ID"])
+        sys.exit(run_array_task(user_arguments.task_manifest, task_id))
+    if user_arguments.derive_vcf:
+        ThresholdSweep(
+            user_arguments.derive_vcf,
+            priority_score_range(),
+            user_arguments.output_location,
+        ).write_tsv_files()
+        sys.exit(0)
     vcf = Variants(user_arguments.vcf_file)
     if user_arguments.update_vcf:
         sys.exit(0)
@@ -495,6 +1280,20 @@ def main():
             user_arguments.hpo_terms,
             user_arguments.output_name,
         )
+        jobs_file = (
+            user_arguments.output_location
+            + "/"
+            + yaml.exomiser_output_name
+            + ".jobs.json"
+        )
+        if user_arguments.executor == "local":
+            monitor = LocalExecutor(
+                jobs_file,
+                user_arguments.max_parallel,
+                (user_arguments.max_memory or 0) * 2**30,
+            )
+        else:
+            monitor = JobMonitor(jobs_file, **monitor_settings)
         exomiser = Exomiser(
             yaml.fill_output_options(),
             user_arguments.output_location,
@@ -505,8 +1304,22 @@ def main():
             vcf.vcf_file,
             user_arguments.config_location,
             user_arguments.log_file,
+            monitor,
         )
-        exomiser.run_exomiser()
+        if user_arguments.adaptive:
+            exomiser.run_adaptive(
+                user_arguments.coarse_step, user_arguments.fine_step
+            )
+        elif user_arguments.sweep:
+            exomiser.run_sweep()
+        elif user_arguments.executor == "slurm-array":
+            exomiser.run_exomiser_array(user_arguments.array_throttle)
+        else:
+            exomiser.run_exomiser()
+        # The local executor only runs the jobs while waiting for them.
+        if user_arguments.wait or user_arguments.executor == "local":
+            failed = exomiser.monitor.wait(user_arguments.notify_command)
+            sys.exit(1 if failed else 0)
 
 
 if __name__ == "__main__":
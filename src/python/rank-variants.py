@@ -22,9 +22,20 @@
 
 # Imports:
 import argparse
-import re
+import contextlib
+import csv
+import heapq
+import multiprocessing
+import numpy as np
+import os
 import pandas as pd
+import sys
+import tempfile
 from cyvcf2 import VCF
+from feature_cache import FeatureCache, file_digest
+from phen2gene_table import Phen2GeneTable
+from score_normalisation import ScoreNormaliser
+from vcf_annotation import AnnotationParser, to_float
 
 
 class RANK:
@@ -33,76 +44,77 @@ class RANK:
         This class takes care of
 
         This function creates a number of class attributes:
-            vep_annotation = a list of strings with the names of each section
-                             of annotation that VEP could add to a variant.
-            exomiser_annotation = a list of strings with the names of each
-                                  annotation field that exomiser adds to a
-                                  variant.
+            features = a list of strings with the names of the seven scores
+                       that are used for the ranking, in column order.
+            weights = a dictionary with the weight of each feature in the
+                      final variant score.
+            header = a list of strings with the column names of the output
+                     tsv file.
     """
 
-    vep_annotation = [
-        "Allele",
-        "Consequence",
-        "IMPACT",
-        "SYMBOL",
-        "Gene",
-        "Feature_type",
-        "Feature",
-        "BIOTYPE",
-        "EXON",
-        "INTRON",
-        "HGVSc",
-        "HGVSp",
-        "cDNA_position",
-        "CDS_position",
-        "Protein_position",
-        "Amino_acids",
-        "Codons",
-        "Existing_variation",
-        "DISTANCE",
-        "STRAND",
-        "FLAGS",
-        "SYMBOL_SOURCE",
-        "HGNC_ID",
+    features = [
         "CADD_PHRED",
         "CADD_RAW",
         "CAPICE_SCORE",
         "FATHMM_MKL_C",
         "FATHMM_MKL_NC",
-    ]
-    exomiser_annotation = [
-        "RANK",
-        "ID",
-        "GENE_SYMBOL",
-        "ENTREZ_GENE_ID",
-        "MOI",
-        "P-VALUE",
         "EXOMISER_GENE_COMBINED_SCORE",
-        "EXOMISER_GENE_PHENO_SCORE",
-        "EXOMISER_GENE_VARIANT_SCORE",
-        "EXOMISER_VARIANT_SCORE",
-        "CONTRIBUTING_VARIANT",
-        "WHITELIST_VARIANT",
-        "FUNCTIONAL_CLASS",
-        "HGVS",
-        "EXOMISER_ACMG_CLASSIFICATION",
-        "EXOMISER_ACMG_EVIDENCE",
-        "EXOMISER_ACMG_DISEASE_ID",
-        "EXOMISER_ACMG_DISEASE_NAME",
+        "PHEN2GENE_RANK",
     ]
+    weights = {
+        "CADD_PHRED": 0.175,
+        "CADD_RAW": 0.267,
+        "CAPICE_SCORE": 0.135,
+        "FATHMM_MKL_C": 0.011,
+        "FATHMM_MKL_NC": 0.040,
+        "EXOMISER_GENE_COMBINED_SCORE": 0.358,
+        "PHEN2GENE_RANK": 0.014,
+    }
+    header = ["CHROM", "POS", "REF", "ALT"] + features + ["VARIANT_SCORE"]
 
-    def __init__(self, vcf_file, output_name, phen2gene_file):
+    def __init__(
+        self,
+        vcf_file,
+        output_name,
+        phen2gene_table,
+        chunk_size,
+        feature_cache=None,
+        transcripts="first",
+        weights=None,
+        normaliser=None,
+    ):
         """
         The initializer function:
             This function creates a number of instance attributes:
                 vcf = the input vcf file that needs to be ranked.
                 output = a string to use as the output name of the ranked
                          variants.
-                phen2gene_file = the phen2gene ranked gene file.
+                phen2gene = the compiled phen2gene gene to rank table.
+                chunk_size = the number of variants that are scored together
+                             as one batch.
+                feature_cache = a FeatureCache object to store and reuse the
+                                raw features of the vcf file, or None.
+                transcripts = a string that decides which CSQ entries of a
+                              variant are scored: first, worst or canonical.
+                weights = a dictionary with feature weights that replaces the
+                          default weights, or None.
+                normaliser = a ScoreNormaliser object with the ranges of each
+                             feature, by default the fixed scoring ranges.
+                             The maximum phen2gene rank is always taken from
+                             the phen2gene table.
         """
         self.vcf = vcf_file
         self.output = output_name
-        self.phen2gene = phen2gene_file
+        self.phen2gene = phen2gene_table
+        self.chunk_size = chunk_size
+        self.feature_cache = feature_cache
+        self.transcripts = transcripts
+        if weights:
+            self.weights = weights
+        if normaliser:
+            self.normaliser = normaliser.with_max_rank(phen2gene_table.max_rank)
+        else:
+            self.normaliser = ScoreNormaliser.default(phen2gene_table.max_rank)
 
     @property
     def vcf(self):
@@ -121,189 +133,154 @@ class RANK:
         """
         self._vcf = VCF(value)
 
-    def parse_exomiser_info(self, info_field):
+    def normalise_scores(self, scores):
+        """
+        The normalise_scores function:
+            This function takes a matrix with the relevant annotation scores,
+            one column per feature, and normalises these to a range between 0
+            and 1 with the score normaliser. Missing scores (NaN) are set to 0.
+            The normalised values are returned in a new matrix.
+        """
+        return self.normaliser.normalise(scores)
+
+    def rank_variants(self, normalised_scores):
+        """
+        The rank_variant function:
+            This function calculates the weighted sum of the normalised scores
+            for every row in the matrix. The weights are added feature by
+            feature so the result matches a per-variant summation. The array of
+            variant scores is returned.
+        """
+        variant_rank = np.zeros(normalised_scores.shape[0])
+        for index, feature in enumerate(self.features):
+            variant_rank += normalised_scores[:, index] * self.weights[feature]
+        return variant_rank
+
+    def read_chunks(self):
         """
-        The parse_exomiser_info function:
-            This function selects a string in between two brackets. It selects
-            the first element/group and splits on a pipe character. The list is
-            returned.
+        The read_chunks function:
+            This function yields the raw features in chunks. If a feature
+            cache is used and the vcf file was cached before, the chunks are
+            read from the cache. Otherwise the vcf file is parsed, and every
+            chunk is written to the cache while it streams past.
         """
-        match = re.match(r"\{([^{}]+)\}", info_field)
-        if match:
-            first_set = match.group(1)
-            elements = first_set.split("|")
-            return elements
+        if self.feature_cache is None:
+            yield from self.parse_chunks()
+        elif self.feature_cache.exists():
+            yield from self.feature_cache.load_chunks(self.chunk_size)
         else:
-            return []
+            yield from self.feature_cache.write_chunks(self.parse_chunks())
 
-    def custom_normalisation(self, x, benign_range, pathogenic_range):
+    def parse_chunks(self):
         """
-        The custom_normalisation function:
-            This function takes a value, and two lists. These lists represent
-            a range in which the value could be. Depending on the value, it is
-            scaled to either a score between 0 and 0.5 or 0.5 and 1.0. This
-            score is returned.
+        The parse_chunks function:
+            This function reads the vcf file in chunks of chunk_size variants.
+            For each chunk the variant positions are collected in lists and the
+            seven features are collected in a matrix with one column per
+            feature. Each chunk is yielded as a tuple of the position lists
+            and the score matrix.
         """
-        if x <= benign_range[1]:
-            return (
-                0.5
-                * (x - benign_range[0])
-                / (benign_range[1] - benign_range[0])
+        parser = AnnotationParser(self.vcf)
+        csq_extractor = parser.csq_matrix_extractor(
+            self.features[:5], self.transcripts
+        )
+        exomiser_extractor = parser.exomiser_extractor(
+            ["EXOMISER_GENE_COMBINED_SCORE", "GENE_SYMBOL"]
+        )
+        positions = [[], [], [], []]
+        csq_infos = []
+        exomiser_rows = []
+        for variant in self.vcf:
+            positions[0].append(variant.CHROM)
+            positions[1].append(variant.POS)
+            positions[2].append(variant.REF)
+            positions[3].append(variant.ALT)
+            csq_infos.append(variant.INFO.get("CSQ", ""))
+            exomiser_rows.append(
+                exomiser_extractor(variant.INFO.get("Exomiser", ""))
             )
-        else:
-            return 0.5 + 0.5 * (x - pathogenic_range[0]) / (
-                pathogenic_range[1] - pathogenic_range[0]
+            if len(csq_infos) == self.chunk_size:
+                yield positions, self.build_chunk(
+                    csq_extractor(csq_infos), exomiser_rows
+                )
+                positions = [[], [], [], []]
+                csq_infos = []
+                exomiser_rows = []
+        if csq_infos:
+            yield positions, self.build_chunk(
+                csq_extractor(csq_infos), exomiser_rows
             )
 
-    def normalise_scores(self, scores):
+    def build_chunk(self, csq_scores, exomiser_rows):
         """
-        The normalise_scores function:
-            This function takes a dictionary with the relevant annotation
-            scores and normalises these to a range between 0 and 1. The
-            normalised values are returned in a new dictionary.
-        """
-        normalised_scores = {}
-        for key, value in scores.items():
-            if value == 0.0:
-                normalised_scores[key] = value
-            else:
-                if key == "CADD_PHRED":
-                    normalised_scores["CADD_PHRED"] = (
-                        float(value) + 1.0 + 1.0
-                    ) / 65.0
-                elif key == "CADD_RAW":
-                    normalised_scores["CADD_RAW"] = self.custom_normalisation(
-                        float(value), [-5.0, 1.654], [1.654, 15.0]
-                    )
-                elif key == "FATHMM_MKL_C":
-                    normalised_scores["FATHMM_MKL_C"] = (
-                        self.custom_normalisation(
-                            float(value), [-99.0, 0.123], [0.123, 5.0]
-                        )
-                    )
-                elif key == "FATHMM_MKL_NC":
-                    normalised_scores["FATHMM_MKL_NC"] = (
-                        self.custom_normalisation(
-                            float(value), [-99.0, 0.2137], [0.2137, 5.0]
-                        )
-                    )
-                elif key == "PHEN2GENE_RANK":
-                    normalised_scores["PHEN2GENE_RANK"] = 1.0 - (
-                        float(value) / 10843.0
-                    )
-                elif (
-                    key == "CAPICE_SCORE"
-                    or key == "EXOMISER_GENE_COMBINED_SCORE"
-                ):
-                    normalised_scores[key] = float(value)
-        return normalised_scores
+        The build_chunk function:
+            This function combines the VEP score matrix of a chunk with the
+            Exomiser scores and phen2gene ranks into the full score matrix.
+            Genes that are not in the phen2gene list get the lowest rank. The
+            score matrix is returned.
+        """
+        scores = np.empty((len(csq_scores), len(self.features)))
+        scores[:, :5] = csq_scores
+        exomiser_scores, genes = zip(*exomiser_rows)
+        scores[:, 5] = to_float(exomiser_scores)
+        scores[:, 6] = self.phen2gene.rank_array(genes)
+        return scores
 
-    def rank_variants(self, normalised_scores):
+    def score_chunks(self):
         """
-        The rank_variant function:
+        The score_chunks function:
+            This function normalises and ranks the score matrix of each chunk.
+            The position lists, the normalised scores and the variant scores
+            are yielded per chunk.
+        """
+        for positions, scores in self.read_chunks():
+            normalised_scores = self.normalise_scores(scores)
+            yield positions, normalised_scores, self.rank_variants(
+                normalised_scores
+            )
 
+    def format_lines(self, positions, normalised_scores, variant_rank):
         """
-        variant_rank = 0
-        weights = {
-            "CADD_PHRED": 0.175,
-            "CADD_RAW": 0.267,
-            "CAPICE_SCORE": 0.135,
-            "FATHMM_MKL_C": 0.011,
-            "FATHMM_MKL_NC": 0.040,
-            "EXOMISER_GENE_COMBINED_SCORE": 0.358,
-            "PHEN2GENE_RANK": 0.014,
-        }
-        for key, value in normalised_scores.items():
-            variant_rank += value * weights[key]
-        return variant_rank
+        The format_lines function:
+            This function converts a scored chunk into tab separated lines for
+            the output file. The list of lines is returned.
+        """
+        return [
+            "\t".join(map(str, row)) + "\n"
+            for row in zip(
+                *positions,
+                *normalised_scores.T.tolist(),
+                variant_rank.tolist(),
+            )
+        ]
+
+    def open_output(self):
+        """
+        The open_output function:
+            This function opens the output tsv file for writing. If the output
+            name is "-", the ranked variants are written to standard output.
+        """
+        if self.output == "-":
+            return contextlib.nullcontext(sys.stdout)
+        return open(self.output + ".tsv", "w")
 
     def extract_info(self):
         """
         The extract_info function:
-            This function
-        """
-        phen2gene_df = pd.read_csv(self.phen2gene, delimiter="\t")
-        phen2gene_df.set_index("Gene", inplace=True)
-        with open(self.output + ".tsv", "w") as file_out:
-            file_out.write(
-                f"CHROM\tPOS\tREF\tALT\t"
-                f"CADD_PHRED\tCADD_RAW\tCAPICE_SCORE\t"
-                f"FATHMM_MKL_C\tFATHMM_MKL_NC\t"
-                f"EXOMISER_GENE_COMBINED_SCORE\t"
-                f"PHEN2GENE_RANK\tVARIANT_SCORE\n"
-            )
-            for variant in self.vcf:
-                chrom = variant.CHROM
-                pos = variant.POS
-                ref = variant.REF
-                alt = variant.ALT
-                csq_info = variant.INFO.get("CSQ", "")
-                csq_annotation = csq_info.split(",")[0].split("|")
-                csq_annotation_dict = dict(
-                    zip(self.vep_annotation, csq_annotation)
-                )
-                exomiser_annotation = self.parse_exomiser_info(
-                    variant.INFO.get("Exomiser", "")
-                )
-                exomiser_annotation_dict = dict(
-                    zip(self.exomiser_annotation, exomiser_annotation)
-                )
-                if (
-                    exomiser_annotation_dict["GENE_SYMBOL"]
-                    in phen2gene_df.index
-                ):
-                    phen2gene_rank = phen2gene_df.loc[
-                        exomiser_annotation_dict["GENE_SYMBOL"], "Rank"
-                    ]
-                else:
-                    phen2gene_rank = 10843
-                scores = {
-                    "CADD_PHRED": (
-                        csq_annotation_dict["CADD_PHRED"]
-                        if csq_annotation_dict["CADD_PHRED"]
-                        else 0.0
-                    ),
-                    "CADD_RAW": (
-                        csq_annotation_dict["CADD_RAW"]
-                        if csq_annotation_dict["CADD_RAW"]
-                        else 0.0
-                    ),
-                    "CAPICE_SCORE": (
-                        csq_annotation_dict["CAPICE_SCORE"]
-                        if csq_annotation_dict["CAPICE_SCORE"]
-                        else 0.0
-                    ),
-                    "FATHMM_MKL_C": (
-                        csq_annotation_dict["FATHMM_MKL_C"]
-                        if csq_annotation_dict["FATHMM_MKL_C"]
-                        else 0.0
-                    ),
-                    "FATHMM_MKL_NC": (
-                        csq_annotation_dict["FATHMM_MKL_NC"]
-                        if csq_annotation_dict["FATHMM_MKL_NC"]
-                        else 0.0
-                    ),
-                    "EXOMISER_GENE_COMBINED_SCORE": (
-                        exomiser_annotation_dict["EXOMISER_GENE_COMBINED_SCORE"]
-                        if exomiser_annotation_dict[
-                            "EXOMISER_GENE_COMBINED_SCORE"
-                        ]
-                        else 0.0
-                    ),
-                    "PHEN2GENE_RANK": phen2gene_rank,
-                }
-                normalised_scores = self.normalise_scores(scores)
-                variant_rank = self.rank_variants(normalised_scores)
-                file_out.write(
-                    f"{chrom}\t{pos}\t{ref}\t{alt}\t"
-                    f"{normalised_scores["CADD_PHRED"]}\t"
-                    f"{normalised_scores["CADD_RAW"]}\t"
-                    f"{normalised_scores["CAPICE_SCORE"]}\t"
-                    f"{normalised_scores["FATHMM_MKL_C"]}\t"
-                    f"{normalised_scores["FATHMM_MKL_NC"]}\t"
-                    f"{normalised_scores["EXOMISER_GENE_COMBINED_SCORE"]}\t"
-                    f"{normalised_scores["PHEN2GENE_RANK"]}\t"
-                    f"{variant_rank}\n"
+            This function writes the normalised scores and the variant score
+            of every variant to a tsv file, one chunk at a time.
+        """
+        with self.open_output() as file_out:
+            file_out.write("\t".join(self.header) + "\n")
+            for (
+                positions,
+                normalised_scores,
+                variant_rank,
+            ) in self.score_chunks():
+                file_out.writelines(
+                    self.format_lines(
+                        positions, normalised_scores, variant_rank
+                    )
                 )
 
     def sort_tsv(self):
@@ -316,6 +293,263 @@ class RANK:
         df_sorted = df.sort_values(by="VARIANT_SCORE", ascending=False)
         df_sorted.to_csv(self.output + ".tsv", sep="\t", index=False)
 
+    def select_rows(self, positions, normalised_scores, variant_rank, rows):
+        """
+        The select_rows function:
+            This function takes a scored chunk and an array of row indices and
+            returns the formatted lines of just those rows, in the given order.
+        """
+        return self.format_lines(
+            [[column[row] for row in rows] for column in positions],
+            normalised_scores[rows],
+            variant_rank[rows],
+        )
+
+    def top_variants(self, top_k):
+        """
+        The top_variants function:
+            This function streams through the scored chunks and keeps a heap
+            of the top_k highest scoring variants. Per chunk only the top_k
+            candidates are selected with numpy before they are offered to the
+            heap, so memory stays bounded by top_k. Variants with equal scores
+            keep their input order. The ranked variants are written to the
+            output tsv file.
+        """
+        heap = []
+        offset = 0
+        for positions, normalised_scores, variant_rank in self.score_chunks():
+            rows = np.arange(len(variant_rank))
+            if len(rows) > top_k:
+                # A stable selection, equal scores at the cut-off keep the
+                # first rows of the chunk.
+                rows = np.lexsort((rows, -variant_rank))[:top_k]
+            lines = self.select_rows(
+                positions, normalised_scores, variant_rank, rows
+            )
+            for row, line in zip(rows.tolist(), lines):
+                item = (variant_rank[row], -(offset + row), line)
+                if len(heap) < top_k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+            offset += len(variant_rank)
+        with self.open_output() as file_out:
+            file_out.write("\t".join(self.header) + "\n")
+            for _, _, line in sorted(heap, reverse=True):
+                file_out.write(line)
+
+    def external_sort(self):
+        """
+        The external_sort function:
+            This function creates a full ordering of all variants without
+            holding them in memory. Every scored chunk is sorted on the
+            variant score and written to a temporary run file, after which the
+            run files are merged into the output tsv file. Variants with equal
+            scores keep their input order.
+        """
+        with tempfile.TemporaryDirectory() as temp_folder:
+            run_files = []
+            for (
+                positions,
+                normalised_scores,
+                variant_rank,
+            ) in self.score_chunks():
+                run_files.append(
+                    os.path.join(temp_folder, f"{len(run_files)}.tsv")
+                )
+                with open(run_files[-1], "w") as run_out:
+                    run_out.writelines(
+                        self.select_rows(
+                            positions,
+                            normalised_scores,
+                            variant_rank,
+                            np.argsort(-variant_rank, kind="stable"),
+                        )
+                    )
+            runs = [open(run_file, "r") for run_file in run_files]
+            try:
+                with self.open_output() as file_out:
+                    file_out.write("\t".join(self.header) + "\n")
+                    file_out.writelines(
+                        heapq.merge(
+                            *runs,
+                            key=lambda line: -float(line.rsplit("\t", 1)[1]),
+                        )
+                    )
+            finally:
+                for run in runs:
+                    run.close()
+
+
+class Cohort:
+    """
+    The Cohort class:
+        This class collects the samples that are ranked in a single run, either
+        from a list of vcf files or from a sample sheet, and combines the
+        ranked tsv files of all samples into one cohort table.
+    """
+
+    def __init__(self, vcf_files, sample_sheet, output_name):
+        """
+        The initializer function:
+            This function creates a number of instance attributes:
+                vcf_files = a list of full paths to vcf files.
+                sample_sheet = the full path to a tab separated file with a
+                               SAMPLE and VCF column, and optionally an
+                               OUTPUT column.
+                output_name = the output name for a single vcf file, or the
+                              output folder when multiple vcf files are
+                              ranked.
+                samples = a list of tuples with the sample name, vcf file and
+                          output name of each sample.
+        """
+        self.vcf_files = vcf_files
+        self.sample_sheet = sample_sheet
+        self.output_name = output_name
+        self.samples = []
+
+    def sample_name(self, vcf_file):
+        """
+        The sample_name function:
+            This function returns the file name of a vcf up to the first dot,
+            which is used as sample name.
+        """
+        return os.path.basename(vcf_file).split(".")[0]
+
+    def default_output(self, vcf_file):
+        """
+        The default_output function:
+            This function replaces the vcf extension of a file with ranking.
+            If an output folder is given, the file is placed in that folder.
+        """
+        for extension in [".vcf.gz", ".vcf"]:
+            if vcf_file.endswith(extension):
+                vcf_file = vcf_file[: -len(extension)]
+                break
+        if self.output_name:
+            return os.path.join(
+                self.output_name, os.path.basename(vcf_file) + ".ranking"
+            )
+        return vcf_file + ".ranking"
+
+    def collect_samples(self):
+        """
+        The collect_samples function:
+            This function fills the list of samples. A single vcf file uses the
+            output name as is, multiple vcf files and sample sheet entries
+            without an OUTPUT column get an output name based on the vcf name.
+            The list of samples is returned.
+        """
+        if self.sample_sheet:
+            with open(self.sample_sheet, "r") as file:
+                for row in csv.DictReader(file, delimiter="\t"):
+                    self.samples.append(
+                        (
+                            row["SAMPLE"],
+                            row["VCF"],
+                            row.get("OUTPUT")
+                            or self.default_output(row["VCF"]),
+                        )
+                    )
+        elif len(self.vcf_files) == 1:
+            self.samples.append(
+                (
+                    self.sample_name(self.vcf_files[0]),
+                    self.vcf_files[0],
+                    self.output_name,
+                )
+            )
+        else:
+            for vcf_file in self.vcf_files:
+                self.samples.append(
+                    (
+                        self.sample_name(vcf_file),
+                        vcf_file,
+                        self.default_output(vcf_file),
+                    )
+                )
+        return self.samples
+
+    def combine_tsv(self, cohort_file):
+        """
+        The combine_tsv function:
+            This function writes the ranked variants of all samples to one
+            cohort tsv file, with the sample name as first column.
+        """
+        with open(cohort_file, "w") as file_out:
+            file_out.write("SAMPLE\t" + "\t".join(RANK.header) + "\n")
+            for sample, _, output_name in self.samples:
+                with open(output_name + ".tsv", "r") as file:
+                    next(file)
+                    for line in file:
+                        file_out.write(sample + "\t" + line)
+
+
+def read_weights(weights_file):
+    """
+    The read_weights function:
+        This function reads a tab separated file with a FEATURE and WEIGHT
+        column, as written by the weight search in calculate-final-rank.py.
+        The weights are returned in a dictionary, together with the path of
+        the normalisation file named on the "# NORMALISATION=" line, or None.
+    """
+    normalisation_file = None
+    with open(weights_file, "r") as file:
+        lines = []
+        for line in file:
+            if line.startswith("# NORMALISATION="):
+                normalisation_file = line.split("=", 1)[1].strip()
+            elif not line.startswith("#"):
+                lines.append(line)
+        weights = {
+            row["FEATURE"]: float(row["WEIGHT"])
+            for row in csv.DictReader(lines, delimiter="\t")
+        }
+    if set(weights) != set(RANK.features):
+        raise ValueError(
+            "The weights file should contain exactly these features: "
+            + ", ".join(RANK.features)
+        )
+    return weights, normalisation_file
+
+
+def rank_sample(
+    vcf_file, output_name, phen2gene_table, weights, normaliser, user_arguments
+):
+    """
+    The rank_sample function:
+        This function is used to rank the variants of a single sample. It
+        creates a RANK object and calls the ranking functions of the ranking
+        mode selected in the user arguments.
+    """
+    feature_cache = None
+    if user_arguments.cache_folder:
+        feature_cache = FeatureCache(
+            user_arguments.cache_folder,
+            vcf_file,
+            {
+                "phen2gene": file_digest(phen2gene_table.phen2gene_file),
+                "transcripts": user_arguments.transcripts,
+            },
+        )
+    ranking = RANK(
+        vcf_file,
+        output_name,
+        phen2gene_table,
+        user_arguments.chunk_size,
+        feature_cache,
+        user_arguments.transcripts,
+        weights,
+        normaliser,
+    )
+    if user_arguments.top_k:
+        ranking.top_variants(user_arguments.top_k)
+    elif user_arguments.external_sort or output_name == "-":
+        ranking.external_sort()
+    else:
+        ranking.extract_info()
+        ranking.sort_tsv()
+
 
 def parse_argvs():
     """
@@ -325,7 +559,8 @@ def parse_argvs():
     """
     description = "This script normalizes the input scores and ranks the\
                    variants."
-    epilog = "This python script has two dependencies: cyvcf2 and pandas."
+    epilog = "This python script has three dependencies: cyvcf2, numpy and\
+              pandas."
     parser = argparse.ArgumentParser(
         description=description,
         epilog=epilog,
@@ -344,10 +579,22 @@ def parse_argvs():
         "-f",
         "--filtered-vcf",
         action="store",
-        dest="filtered_file",
+        dest="filtered_files",
         type=str,
-        default=argparse.SUPPRESS,
-        help="the full path to the vep and exomiser filtered vcf file.",
+        nargs="+",
+        default=[],
+        help="the full path to one or more vep and exomiser filtered vcf\
+              files, use - to read a single vcf from standard input.",
+    )
+    parser.add_argument(
+        "-m",
+        "--sample-sheet",
+        action="store",
+        dest="sample_sheet",
+        type=str,
+        default=None,
+        help="the full path to a tab separated file with a SAMPLE and VCF\
+              column, and optionally an OUTPUT column, to rank a cohort.",
     )
     parser.add_argument(
         "-o",
@@ -355,13 +602,126 @@ def parse_argvs():
         action="store",
         dest="output_file",
         type=str,
-        default=argparse.SUPPRESS,
-        help="the full path to the output file.",
+        default=None,
+        help="the full path to the output file excluding a tsv extension, or\
+              - for standard output (sorted with --external-sort). When\
+              ranking multiple vcf files this is the output folder, if left\
+              empty the output is written next to each vcf file.",
+    )
+    parser.add_argument(
+        "-a",
+        "--cohort-output",
+        action="store",
+        dest="cohort_file",
+        type=str,
+        default=None,
+        help="the full path to a tsv file that combines the ranked variants\
+              of all samples.",
+    )
+    parser.add_argument(
+        "-t",
+        "--cores",
+        action="store",
+        dest="cores",
+        type=int,
+        default=1,
+        help="the number of samples to rank in parallel.",
+    )
+    parser.add_argument(
+        "-c",
+        "--chunk-size",
+        action="store",
+        dest="chunk_size",
+        type=int,
+        default=50000,
+        help="the number of variants to normalise and score as one batch.",
+    )
+    parser.add_argument(
+        "-k",
+        "--top-k",
+        action="store",
+        dest="top_k",
+        type=int,
+        default=None,
+        help="only keep the k highest scoring variants, ranked in a single\
+              streaming pass.",
+    )
+    parser.add_argument(
+        "-s",
+        "--external-sort",
+        action="store_true",
+        dest="external_sort",
+        help="rank all variants in a single streaming pass by merging sorted\
+              chunks from temporary files, instead of sorting the full table\
+              in memory.",
+    )
+    parser.add_argument(
+        "-n",
+        "--transcripts",
+        action="store",
+        dest="transcripts",
+        type=str,
+        choices=AnnotationParser.transcript_modes,
+        default="first",
+        help="which CSQ entries of a variant to score: the first entry, the\
+              highest score of each feature over all entries (worst), or\
+              the canonical transcript (requires VEP --canonical).",
+    )
+    parser.add_argument(
+        "-w",
+        "--weights",
+        action="store",
+        dest="weights_file",
+        type=str,
+        default=None,
+        help="the full path to a tab separated file with feature weights, as\
+              written by the weight search of calculate-final-rank.py. The\
+              weights only fit the normalisation ranges they were searched\
+              with, so the normalisation file named in the weights file is\
+              loaded unless --normalisation is given.",
+    )
+    parser.add_argument(
+        "-r",
+        "--feature-cache",
+        action="store",
+        dest="cache_folder",
+        type=str,
+        default=None,
+        help="the full path to a folder in which the raw features of each vcf\
+              file are cached, a vcf file that was ranked before is then\
+              scored from the cache instead of being parsed again.",
+    )
+    parser.add_argument(
+        "-l",
+        "--normalisation",
+        action="store",
+        dest="normalisation_file",
+        type=str,
+        default=None,
+        help="the full path to a json file with the normalisation ranges of\
+              each feature, as written by calculate-final-rank.py, that\
+              replace the fixed scoring ranges. The maximum phen2gene rank is\
+              always taken from the phen2gene file.",
     )
     parser.add_argument(
         "-v", "--version", action="version", version="%(prog)s [1.0]]"
     )
     argvs = parser.parse_args()
+    if bool(argvs.filtered_files) == bool(argvs.sample_sheet):
+        parser.error("provide either --filtered-vcf or --sample-sheet.")
+    if len(argvs.filtered_files) == 1 and not argvs.output_file:
+        parser.error("--output is required when ranking a single vcf file.")
+    if "-" in argvs.filtered_files and len(argvs.filtered_files) > 1:
+        parser.error("only a single vcf file can be read from standard input.")
+    if "-" in argvs.filtered_files and argvs.cache_folder:
+        parser.error("the feature cache can not be used with standard input.")
+    if argvs.output_file == "-" and (
+        len(argvs.filtered_files) != 1 or argvs.cohort_file
+    ):
+        parser.error(
+            "standard output can only be used when ranking a single vcf file"
+            " without a cohort output."
+        )
     return argvs
 
 
@@ -371,13 +731,55 @@ def main():
         This function calls all processing functions in correct order.
     """
     user_arguments = parse_argvs()
-    ranking = RANK(
-        user_arguments.filtered_file,
+    cohort = Cohort(
+        user_arguments.filtered_files,
+        user_arguments.sample_sheet,
         user_arguments.output_file,
-        user_arguments.phen2gene_file,
     )
-    ranking.extract_info()
-    ranking.sort_tsv()
+    phen2gene_table = Phen2GeneTable(user_arguments.phen2gene_file)
+    weights = None
+    normalisation_file = user_arguments.normalisation_file
+    if user_arguments.weights_file:
+        weights, weights_normalisation = read_weights(
+            user_arguments.weights_file
+        )
+        if not normalisation_file:
+            normalisation_file = weights_normalisation
+        elif weights_normalisation and os.path.abspath(
+            normalisation_file
+        ) != os.path.abspath(weights_normalisation):
+            print(
+                "The weights were searched with the normalisation ranges of "
+                + weights_normalisation
+                + ", not of "
+                + normalisation_file
+                + ".",
+                file=sys.stderr,
+            )
+    normaliser = None
+    if normalisation_file:
+        normaliser = ScoreNormaliser.load(normalisation_file)
+    arguments = [
+        (
+            vcf_file,
+            output_name,
+            phen2gene_table,
+            weights,
+            normaliser,
+            user_arguments,
+        )
+        for _, vcf_file, output_name in cohort.collect_samples()
+    ]
+    if user_arguments.cores > 1 and len(arguments) > 1:
+        pool = multiprocessing.Pool(processes=user_arguments.cores)
+        pool.starmap(rank_sample, arguments)
+        pool.close()
+        pool.join()
+    else:
+        for argument in arguments:
+            rank_sample(*argument)
+    if user_arguments.cohort_file:
+        cohort.combine_tsv(user_arguments.cohort_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+# -----------------------------------------------------------------------------
+# GenomeScan internship repository.
+# Copyright (C) 2023 Jasper Boom
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Contact information: info@jboom.org.
+# -----------------------------------------------------------------------------
+
+
+# Imports:
+import json
+import numpy as np
+
+
+class ScoreNormaliser:
+    """
+    The ScoreNormaliser class:
+        This class normalises a matrix of annotation scores, one column per
+        feature, to a range between 0 and 1. Every normalised feature has a
+        set of ranges: a shift and maximum (min max scaling), a benign and a
+        pathogenic range (knowledge-based scaling) or a maximum rank (max
+        scaling). Features without ranges are used as they are. The ranges are
+        either the fixed ranges used for scoring, fitted on training data, or
+        read from a json file.
+
+        This function creates a number of class attributes:
+            features = a list of strings with the names of the seven scores,
+                       in column order.
+            thresholds = a dictionary with the score that separates the
+                         benign and pathogenic range of the knowledge-based
+                         scaled features.
+            default_ranges = a dictionary with the fixed ranges of each
+                             feature that are used for scoring, the maximum
+                             phen2gene rank depends on the phen2gene list.
+    """
+
+    features = [
+        "CADD_PHRED",
+        "CADD_RAW",
+        "CAPICE_SCORE",
+        "FATHMM_MKL_C",
+        "FATHMM_MKL_NC",
+        "EXOMISER_GENE_COMBINED_SCORE",
+        "PHEN2GENE_RANK",
+    ]
+    thresholds = {
+        "CADD_RAW": 1.654,
+        "FATHMM_MKL_C": 0.123,
+        "FATHMM_MKL_NC": 0.2137,
+    }
+    default_ranges = {
+        "CADD_PHRED": {"method": "shift", "shift": 2.0, "maximum": 65.0},
+        "CADD_RAW": {
+            "method": "knowledge",
+            "benign": [-5.0, 1.654],
+            "pathogenic": [1.654, 15.0],
+        },
+        "FATHMM_MKL_C": {
+            "method": "knowledge",
+            "benign": [-99.0, 0.123],
+            "pathogenic": [0.123, 5.0],
+        },
+        "FATHMM_MKL_NC": {
+            "method": "knowledge",
+            "benign": [-99.0, 0.2137],
+            "pathogenic": [0.2137, 5.0],
+        },
+        "PHEN2GENE_RANK": {"method": "rank", "maximum": None},
+    }
+
+    def __init__(self, ranges):
+        """
+        The initializer function:
+            This function creates an instance attribute:
+                ranges = a dictionary with the ranges of each normalised
+                         feature.
+        """
+        self.ranges = ranges
+
+    @classmethod
+    def default(cls, max_rank):
+        """
+        The default function:
+            This function returns a normaliser with the fixed scoring ranges,
+            using the highest rank of the phen2gene list as maximum rank.
+        """
+        return cls(cls.default_ranges).with_max_rank(max_rank)
+
+    def with_max_rank(self, max_rank):
+        """
+        The with_max_rank function:
+            This function returns a copy of the normaliser in which the maximum
+            phen2gene rank is replaced, as that maximum depends on the
+            phen2gene list of a sample and not on the training data.
+        """
+        ranges = json.loads(json.dumps(self.ranges))
+        if "PHEN2GENE_RANK" in ranges:
+            ranges["PHEN2GENE_RANK"]["maximum"] = float(max_rank)
+        return ScoreNormaliser(ranges)
+
+    @classmethod
+    def fit(cls, scores):
+        """
+        The fit function:
+            This function determines the ranges of each feature from a
+            training matrix without missing values. The CADD PHRED scores are
+            shifted by their absolute minimum plus one and divided by their
+            maximum, the benign and pathogenic ranges run from the minimum to
+            the threshold and from the threshold to the maximum, and the
+            phen2gene ranks are divided by their maximum.
+        """
+        return cls.from_extremes(scores.min(axis=0), scores.max(axis=0))
+
+    @classmethod
+    def from_extremes(cls, minimum, maximum):
+        """
+        The from_extremes function:
+            This function determines the ranges of each feature from the
+            minimum and maximum of each feature in the training data, so the
+            ranges can also be fitted on data that is read in chunks.
+        """
+        minimum = np.asarray(minimum, dtype=float).tolist()
+        maximum = np.asarray(maximum, dtype=float).tolist()
+        column = cls.features.index
+        ranges = {
+            "CADD_PHRED": {
+                "method": "shift",
+                "shift": abs(minimum[column("CADD_PHRED")]) + 1,
+                "maximum": maximum[column("CADD_PHRED")],
+            },
+            "PHEN2GENE_RANK": {
+                "method": "rank",
+                "maximum": int(maximum[column("PHEN2GENE_RANK")]),
+            },
+        }
+        for feature, threshold in cls.thresholds.items():
+            ranges[feature] = {
+                "method": "knowledge",
+                "benign": [minimum[column(feature)], threshold],
+                "pathogenic": [threshold, maximum[column(feature)]],
+            }
+        return cls(
+            {
+                feature: ranges[feature]
+                for feature in cls.features
+                if feature in ranges
+            }
+        )
+
+    @classmethod
+    def load(cls, normalisation_file):
+        """
+        The load function:
+            This function reads the ranges from a json file.
+        """
+        with open(normalisation_file, "r") as file:
+            return cls(json.load(file))
+
+    def save(self, normalisation_file):
+        """
+        The save function:
+            This function writes the ranges to a json file.
+        """
+        with open(normalisation_file, "w") as file_out:
+            json.dump(self.ranges, file_out, indent=4)
+            file_out.write("\n")
+
+    def piecewise_linear(self, x, benign_range, pathogenic_range):
+        """
+        The piecewise_linear function:
+            This function takes an array of values, and two lists. These lists
+            represent a range in which the values could be. Depending on the
+            value, it is scaled to either a score between 0 and 0.5 or 0.5 and
+            1.0. The array of scores is returned.
+        """
+        return np.where(
+            x <= benign_range[1],
+            0.5 * (x - benign_range[0]) / (benign_range[1] - benign_range[0]),
+            0.5
+            + 0.5
+            * (x - pathogenic_range[0])
+            / (pathogenic_range[1] - pathogenic_range[0]),
+        )
+
+    def normalise(self, scores):
+        """
+        The normalise function:
+            This function takes a matrix with the scores of the seven features
+            and returns a new matrix with the normalised scores. Missing scores
+            (NaN) are set to 0.
+        """
+        normalised_scores = np.array(scores, dtype=float)
+        missing = np.isnan(normalised_scores)
+        for index, feature in enumerate(self.features):
+            if feature not in self.ranges:
+                continue
+            ranges = self.ranges[feature]
+            x = normalised_scores[:, index]
+            if ranges["method"] == "shift":
+                x = (x + ranges["shift"]) / ranges["maximum"]
+            elif ranges["method"] == "knowledge":
+                x = self.piecewise_linear(
+                    x, ranges["benign"], ranges["pathogenic"]
+                )
+            elif ranges["method"] == "rank":
+                x = 1.0 - (x / ranges["maximum"])
+            else:
+                raise ValueError(
+                    f"Unknown normalisation method for {feature}: "
+                    + str(ranges["method"])
+                )
+            normalised_scores[:, index] = x
+        normalised_scores[missing] = 0.0
+        return normalised_scores
+
+
+# Additional information:
+# =======================
+#
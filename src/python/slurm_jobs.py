@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+
+# -----------------------------------------------------------------------------
+# GenomeScan internship repository.
+# Copyright (C) 2023 Jasper Boom
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Contact information: info@jboom.org.
+# -----------------------------------------------------------------------------
+
+
+# Imports:
+import json
+import os
+import re
+import shlex
+import subprocess
+import time
+
+
+class JobMonitor:
+    """
+    The JobMonitor class:
+        This class submits sbatch jobs, records their job ids in a json file
+        and follows them with squeue and sacct until every job is done. Tasks
+        that ran out of memory, ran out of time or lost their node are
+        submitted again, up to a number of retries. Tasks of a job array are
+        followed and resubmitted per array index. A task that neither squeue
+        nor sacct lists for missing_polls polls in a row, for example because
+        job accounting is disabled, gets the state UNKNOWN and counts as
+        failed. The sbatch, squeue and sacct commands can be replaced, for
+        example by fake-slurm.py to test the monitoring on a computer without
+        slurm.
+
+        This function creates a number of class attributes:
+            active_states = a list of strings with the slurm states of a job
+                            that is not done yet.
+            retry_states = a list of strings with the slurm states of a job
+                           that failed in a way that can be fixed by running
+                           it again.
+            memory_factor = the factor by which the memory of a job is
+                            increased when it is resubmitted after running
+                            out of memory.
+            missing_polls = the number of polls in a row that an active task
+                            may be missing from squeue and sacct before its
+                            state becomes UNKNOWN.
+    """
+
+    active_states = [
+        "PENDING",
+        "CONFIGURING",
+        "RUNNING",
+        "COMPLETING",
+        "REQUEUED",
+        "RESIZING",
+        "SUSPENDED",
+        "SUBMITTED",
+    ]
+    retry_states = ["OUT_OF_MEMORY", "TIMEOUT", "NODE_FAIL", "PREEMPTED"]
+    memory_factor = 1.25
+    missing_polls = 5
+
+    def __init__(
+        self,
+        jobs_file,
+        retries=2,
+        poll_interval=60,
+        sbatch_command="sbatch",
+        squeue_command="squeue",
+        sacct_command="sacct",
+        resume=False,
+    ):
+        """
+        The initializer function:
+            This function creates a number of instance attributes:
+                jobs_file = the full path to the json file with the records
+                            of the submitted tasks.
+                retries = the number of times a task is resubmitted.
+                poll_interval = the number of seconds between two checks of
+                                the job states.
+                sbatch_command = a list of strings with the command used to
+                                 submit jobs.
+                squeue_command = a list of strings with the command used to
+                                 list active jobs.
+                sacct_command = a list of strings with the command used to
+                                list finished jobs.
+                tasks = a dictionary with the record of every task, read
+                        from the jobs file if resume is True and the file
+                        exists, so a new submission starts without the tasks
+                        of an earlier run.
+        """
+        self.jobs_file = jobs_file
+        self.retries = retries
+        self.poll_interval = poll_interval
+        self.sbatch_command = shlex.split(sbatch_command)
+        self.squeue_command = shlex.split(squeue_command)
+        self.sacct_command = shlex.split(sacct_command)
+        self.tasks = {}
+        if resume and os.path.exists(jobs_file):
+            with open(jobs_file, "r") as file:
+                self.tasks = json.load(file)
+
+    def save(self):
+        """
+        The save function:
+            This function writes the jobs file, first under a temporary name
+            so an interrupted run leaves the old records intact.
+        """
+        temp_file = self.jobs_file + ".tmp"
+        with open(temp_file, "w") as file_out:
+            json.dump(self.tasks, file_out, indent=4)
+            file_out.write("\n")
+        os.replace(temp_file, self.jobs_file)
+
+    def sbatch(self, arguments):
+        """
+        The sbatch function:
+            This function submits a job with the sbatch arguments and returns
+            its job id, which sbatch prints because of --parsable.
+        """
+        process = subprocess.run(
+            self.sbatch_command + ["--parsable"] + arguments,
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            raise RuntimeError(
+                "sbatch failed: " + (process.stderr or process.stdout).strip()
+            )
+        return process.stdout.strip().split(";")[0]
+
+    def submit(self, arguments, labels):
+        """
+        The submit function:
+            This function submits a job and records a task for every label.
+            If the arguments describe a job array, the labels are the tasks
+            of the array in order of their index, otherwise there is a single
+            label. The job id is returned.
+        """
+        array = any(argument.startswith("--array=") for argument in arguments)
+        job_id = self.sbatch(arguments)
+        for index, label in enumerate(labels):
+            self.tasks[label] = {
+                "arguments": arguments,
+                "array_index": index if array else None,
+                "job_id": f"{job_id}_{index}" if array else job_id,
+                "job_ids": [],
+                "state": "SUBMITTED",
+                "attempts": 1,
+                "missing_polls": 0,
+            }
+            self.tasks[label]["job_ids"].append(self.tasks[label]["job_id"])
+        self.save()
+        print(f"Submitted job {job_id} with {len(labels)} task(s).")
+        return job_id
+
+    def resubmit(self, labels):
+        """
+        The resubmit function:
+            This function submits tasks again. Tasks of the same job array
+            are submitted as one new job array with only their indices. After
+            running out of memory, the memory of the job is increased by
+            memory_factor.
+        """
+        groups = {}
+        for label in labels:
+            task = self.tasks[label]
+            arguments = list(task["arguments"])
+            if task["state"] == "OUT_OF_MEMORY":
+                arguments = [
+                    self.increase_memory(argument) for argument in arguments
+                ]
+            groups.setdefault(json.dumps(arguments), []).append(label)
+        for key, group in groups.items():
+            arguments = json.loads(key)
+            indices = [self.tasks[label]["array_index"] for label in group]
+            if indices[0] is not None:
+                arguments = [
+                    re.sub(
+                        r"^--array=[^%]*",
+                        "--array=" + ",".join(map(str, indices)),
+                        argument,
+                    )
+                    for argument in arguments
+                ]
+            job_id = self.sbatch(arguments)
+            for label, index in zip(group, indices):
+                task = self.tasks[label]
+                task["arguments"] = json.loads(key)
+                task["job_id"] = (
+                    job_id if index is None else f"{job_id}_{index}"
+                )
+                task["job_ids"].append(task["job_id"])
+                task["state"] = "SUBMITTED"
+                task["attempts"] += 1
+                task["missing_polls"] = 0
+            print(f"Resubmitted {len(group)} task(s) as job {job_id}.")
+        self.save()
+
+    def increase_memory(self, argument):
+        """
+        The increase_memory function:
+            This function multiplies the memory of a --mem argument by
+            memory_factor, other arguments are returned unchanged.
+        """
+        match = re.fullmatch(r"--mem=(\d+)([KMGT]?)", argument)
+        if not match:
+            return argument
+        memory = int(int(match.group(1)) * self.memory_factor + 0.5)
+        return f"--mem={memory}{match.group(2)}"
+
+    def query_states(self):
+        """
+        The query_states function:
+            This function returns a dictionary with the state of every job id
+            that sacct or squeue knows. The states of squeue, with every array
+            task on its own line, replace those of sacct. The output of a
+            command that cannot be run or exits with an error is not used,
+            its error is printed.
+        """
+        job_ids = ",".join(
+            sorted(
+                {task["job_id"].split("_")[0] for task in self.tasks.values()}
+            )
+        )
+        states = {}
+        for command in [
+            self.sacct_command
+            + [
+                "--jobs=" + job_ids,
+                "--format=JobID,State",
+                "--parsable2",
+                "--noheader",
+            ],
+            self.squeue_command
+            + ["--jobs=" + job_ids, "--array", "--noheader", "--format=%i|%T"],
+        ]:
+            try:
+                process = subprocess.run(
+                    command, capture_output=True, text=True
+                )
+            except FileNotFoundError:
+                print(f"Cannot run {command[0]}: command not found.")
+                continue
+            if process.returncode != 0:
+                print(
+                    f"{command[0]} failed with exit code {process.returncode}: "
+                    + process.stderr.strip()
+                )
+                continue
+            for line in process.stdout.splitlines():
+                fields = line.strip().split("|")
+                if len(fields) < 2 or "." in fields[0]:
+                    continue
+                states[fields[0]] = fields[1].split(" ")[0]
+        return states
+
+    def poll(self):
+        """
+        The poll function:
+            This function updates the state of every task and resubmits the
+            tasks that can be retried. An active task that is missing from
+            squeue and sacct for missing_polls polls in a row gets the state
+            UNKNOWN. True is returned if no task is active anymore.
+        """
+        states = self.query_states()
+        retry = []
+        for label, task in self.tasks.items():
+            if task["state"] not in self.active_states:
+                continue
+            if task["job_id"] in states:
+                task["state"] = states[task["job_id"]]
+                task["missing_polls"] = 0
+            else:
+                task["missing_polls"] = task.get("missing_polls", 0) + 1
+                if task["missing_polls"] >= self.missing_polls:
+                    task["state"] = "UNKNOWN"
+                    print(
+                        f"Task {label}: job {task['job_id']} is not known to"
+                        " squeue or sacct, its state is UNKNOWN."
+                    )
+            if (
+                task["state"] in self.retry_states
+                and task["attempts"] <= self.retries
+            ):
+                retry.append(label)
+        self.save()
+        if retry:
+            self.resubmit(retry)
+        return not any(
+            task["state"] in self.active_states for task in self.tasks.values()
+        )
+
+    def failed_tasks(self):
+        """
+        The failed_tasks function:
+            This function returns the labels of the tasks that did not
+            complete.
+        """
+        return [
+            label
+            for label, task in self.tasks.items()
+            if task["state"] != "COMPLETED"
+        ]
+
+    def wait(self, notify_command=None):
+        """
+        The wait function:
+            This function blocks until every task is done, checking the job
+            states every poll_interval seconds. The labels of the failed tasks
+            are printed. If a notify command is given, it is run with a
+            summary on its standard input. The list of failed task labels is
+            returned.
+        """
+        while not self.poll():
+            time.sleep(self.poll_interval)
+        failed = self.failed_tasks()
+        summary = (
+            f"{len(self.tasks) - len(failed)} of {len(self.tasks)} task(s)"
+            " completed.\n"
+        )
+        if failed:
+            summary += "Failed: " + ", ".join(failed) + "\n"
+        print(summary, end="")
+        if notify_command:
+            subprocess.run(notify_command, shell=True, input=summary, text=True)
+        return failed
+
+
+class LocalExecutor(JobMonitor):
+    """
+    The LocalExecutor class:
+        This class runs the jobs that would be submitted to slurm on the local
+        computer instead, in a bounded pool of processes. It takes the same
+        sbatch arguments as the JobMonitor: the --wrap command is run with its
+        standard output and error written to the --output and --error files,
+        so the logs have the same layout as on slurm. A job is only started if
+        fewer than max_parallel jobs run, and if its --mem fits both in the
+        memory budget next to the memory of the running jobs and in the memory
+        that is available right now. A job that needs more than the budget is
+        run on its own. The jobs only run while waiting for them.
+
+        This function creates a class attribute:
+            memory_units = a dictionary with the number of bytes of each unit
+                           of a --mem argument, without unit slurm uses
+                           megabytes.
+    """
+
+    memory_units = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40, "": 2**20}
+
+    def __init__(
+        self, jobs_file, max_parallel=1, max_memory=None, poll_interval=1
+    ):
+        """
+        The initializer function:
+            This function creates a number of instance attributes:
+                max_parallel = the maximum number of jobs that run at the same
+                               time.
+                max_memory = the number of bytes that all running jobs may use
+                             together, by default the memory that is available
+                             at the start.
+                queue = a list of the jobs that did not start yet.
+                running = a dictionary with the process, the memory and the
+                          log files of every running job.
+        """
+        super().__init__(jobs_file, retries=0, poll_interval=poll_interval)
+        self.max_parallel = max_parallel
+        self.max_memory = max_memory or self.available_memory()
+        self.queue = []
+        self.running = {}
+
+    def available_memory(self):
+        """
+        The available_memory function:
+            This function returns the number of bytes of memory that are
+            available for new processes.
+        """
+        try:
+            with open("/proc/meminfo", "r") as file:
+                for line in file:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 2**10
+        except OSError:
+            pass
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+    def parse_memory(self, memory):
+        """
+        The parse_memory function:
+            This function converts the value of a --mem argument to bytes.
+        """
+        match = re.fullmatch(r"(\d+)([KMGT]?)", memory or "0")
+        if not match:
+            raise ValueError(f"Cannot read the memory {memory}.")
+        return int(match.group(1)) * self.memory_units[match.group(2)]
+
+    def submit(self, arguments, labels):
+        """
+        The submit function:
+            This function adds a job to the queue and records its task. Job
+            arrays are run by slurm only.
+        """
+        options = {}
+        for argument in arguments:
+            name, _, value = argument.partition("=")
+            options[name] = value
+        if "--array" in options:
+            raise ValueError("The local executor does not run job arrays.")
+        self.queue.append(
+            {
+                "label": labels[0],
+                "command": options["--wrap"],
+                "output": options["--output"],
+                "error": options.get("--error", options["--output"]),
+                "memory": self.parse_memory(options.get("--mem")),
+            }
+        )
+        self.tasks[labels[0]] = {
+            "arguments": arguments,
+            "array_index": None,
+            "job_id": None,
+            "job_ids": [],
+            "state": "PENDING",
+            "attempts": 1,
+        }
+        self.save()
+
+    def admissible(self, job):
+        """
+        The admissible function:
+            This function checks if a job can start next to the running jobs.
+        """
+        if not self.running:
+            return True
+        if len(self.running) >= self.max_parallel:
+            return False
+        reserved = sum(memory for _, memory, _ in self.running.values())
+        return (
+            reserved + job["memory"] <= self.max_memory
+            and job["memory"] <= self.available_memory()
+        )
+
+    def poll(self):
+        """
+        The poll function:
+            This function records the exit code of the jobs that finished and
+            starts the queued jobs that fit, in order. True is returned if all
+            jobs are done.
+        """
+        for label, (process, _, files) in list(self.running.items()):
+            exit_code = process.poll()
+            if exit_code is None:
+                continue
+            for file in files:
+                file.close()
+            del self.running[label]
+            self.tasks[label]["state"] = (
+                "COMPLETED" if exit_code == 0 else "FAILED"
+            )
+            self.tasks[label]["exit_code"] = exit_code
+            print(f"Task {label}: " + self.tasks[label]["state"])
+        while self.queue and self.admissible(self.queue[0]):
+            job = self.queue.pop(0)
+            output = open(job["output"], "w")
+            error = output
+            if job["error"] != job["output"]:
+                error = open(job["error"], "w")
+            process = subprocess.Popen(
+                job["command"], shell=True, stdout=output, stderr=error
+            )
+            self.running[job["label"]] = (
+                process,
+                job["memory"],
+                {output, error},
+            )
+            self.tasks[job["label"]]["job_id"] = str(process.pid)
+            self.tasks[job["label"]]["job_ids"].append(str(process.pid))
+            self.tasks[job["label"]]["state"] = "RUNNING"
+        self.save()
+        return not self.queue and not self.running
+
+
+# Additional information:
+# =======================
+#
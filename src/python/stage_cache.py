@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+# -----------------------------------------------------------------------------
+# GenomeScan internship repository.
+# Copyright (C) 2023 Jasper Boom
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Contact information: info@jboom.org.
+# -----------------------------------------------------------------------------
+
+
+# Imports:
+import hashlib
+import json
+import os
+import time
+from feature_cache import file_digest
+
+
+class StageCache:
+    """
+    The StageCache class:
+        This class skips the stages of a pipeline whose inputs and parameters
+        did not change since the last run. Every stage is keyed by the content
+        hashes of its input files and its parameters. A manifest (json) file
+        records per stage the key, the hashes of the output files and whether
+        the stage was run or reused in the last run. A stage is only reused if
+        its key matches and its output files still have the recorded hashes.
+    """
+
+    def __init__(self, manifest_file, force_stages=None):
+        """
+        The initializer function:
+            This function creates a number of instance attributes:
+                manifest_file = the full path to the manifest file.
+                force_stages = a list with the names of the stages that are
+                               always run, "all" forces every stage.
+                manifest = a dictionary with the stage records of the
+                           manifest file.
+        """
+        self.manifest_file = manifest_file
+        self.force_stages = force_stages or []
+        self.manifest = {}
+        if os.path.exists(manifest_file):
+            with open(manifest_file, "r") as file:
+                self.manifest = json.load(file)
+
+    def stage_key(self, inputs, parameters):
+        """
+        The stage_key function:
+            This function returns the hashes of the input files and a key that
+            combines these hashes with the stage parameters.
+        """
+        input_digests = {path: file_digest(path) for path in inputs}
+        key = hashlib.sha256(
+            json.dumps(
+                {
+                    "inputs": [input_digests[path] for path in inputs],
+                    "parameters": parameters,
+                },
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+        return input_digests, key
+
+    def reusable(self, stage, key, outputs):
+        """
+        The reusable function:
+            This function checks if a stage can be skipped: it is not forced,
+            its key matches the manifest and all its outputs are unchanged.
+        """
+        if stage in self.force_stages or "all" in self.force_stages:
+            return False
+        record = self.manifest.get(stage)
+        if not record or record["key"] != key:
+            return False
+        for path in outputs:
+            digest = record["outputs"].get(path)
+            if not os.path.exists(path) or file_digest(path) != digest:
+                return False
+        return True
+
+    def run(self, stage, inputs, parameters, outputs, function):
+        """
+        The run function:
+            This function runs the function of a stage, unless the stage can
+            be reused. The outcome is recorded in the manifest file. True is
+            returned if the stage was reused.
+        """
+        input_digests, key = self.stage_key(inputs, parameters)
+        reused = self.reusable(stage, key, outputs)
+        start = time.perf_counter()
+        if reused:
+            output_digests = self.manifest[stage]["outputs"]
+        else:
+            function()
+            output_digests = {path: file_digest(path) for path in outputs}
+        self.manifest[stage] = {
+            "key": key,
+            "inputs": input_digests,
+            "parameters": parameters,
+            "outputs": output_digests,
+            "status": "reused" if reused else "run",
+            "seconds": round(time.perf_counter() - start, 3),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        self.save()
+        print(f"Stage {stage}: " + self.manifest[stage]["status"])
+        return reused
+
+    def save(self):
+        """
+        The save function:
+            This function writes the manifest file, first under a temporary
+            name so an interrupted run leaves the old manifest intact.
+        """
+        temp_file = self.manifest_file + ".tmp"
+        with open(temp_file, "w") as file_out:
+            json.dump(self.manifest, file_out, indent=4)
+            file_out.write("\n")
+        os.replace(temp_file, self.manifest_file)
+
+
+# Additional information:
+# =======================
+#
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+
+# -----------------------------------------------------------------------------
+# GenomeScan internship repository.
+# Copyright (C) 2023 Jasper Boom
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Contact information: info@jboom.org.
+# -----------------------------------------------------------------------------
+
+# Imports:
+import numpy as np
+from operator import itemgetter
+
+
+def to_float(values):
+    """
+    The to_float function:
+        This function converts a sequence of annotation strings to an array of
+        floats. Empty strings become NaN, as do strings that are not a number.
+    """
+    try:
+        return np.array([value or "nan" for value in values], dtype=float)
+    except ValueError:
+        floats = np.full(len(values), np.nan)
+        for index, value in enumerate(values):
+            try:
+                floats[index] = float(value)
+            except ValueError:
+                pass
+        return floats
+
+
+class AnnotationParser:
+    """
+    The AnnotationParser class:
+        This class reads the field names of the VEP (CSQ) and Exomiser
+        annotation from the header of a vcf file and creates extractor
+        functions for a selection of those fields. An extractor takes the raw
+        INFO string of a variant and returns only the requested fields, using
+        precomputed field indices instead of regular expressions or
+        dictionaries. If a vcf header does not describe an annotation, the
+        default field names are used.
+
+        This function creates a number of class attributes:
+            vep_annotation = a list of strings with the default names of each
+                             section of annotation that VEP could add to a
+                             variant.
+            exomiser_annotation = a list of strings with the default names of
+                                  each annotation field that exomiser adds to
+                                  a variant.
+            transcript_modes = a list of strings with the ways in which the
+                               scores of multiple transcripts (CSQ entries)
+                               of a variant can be combined.
+    """
+
+    vep_annotation = [
+        "Allele",
+        "Consequence",
+        "IMPACT",
+        "SYMBOL",
+        "Gene",
+        "Feature_type",
+        "Feature",
+        "BIOTYPE",
+        "EXON",
+        "INTRON",
+        "HGVSc",
+        "HGVSp",
+        "cDNA_position",
+        "CDS_position",
+        "Protein_position",
+        "Amino_acids",
+        "Codons",
+        "Existing_variation",
+        "DISTANCE",
+        "STRAND",
+        "FLAGS",
+        "SYMBOL_SOURCE",
+        "HGNC_ID",
+        "CADD_PHRED",
+        "CADD_RAW",
+        "CAPICE_SCORE",
+        "FATHMM_MKL_C",
+        "FATHMM_MKL_NC",
+    ]
+    exomiser_annotation = [
+        "RANK",
+        "ID",
+        "GENE_SYMBOL",
+        "ENTREZ_GENE_ID",
+        "MOI",
+        "P-VALUE",
+        "EXOMISER_GENE_COMBINED_SCORE",
+        "EXOMISER_GENE_PHENO_SCORE",
+        "EXOMISER_GENE_VARIANT_SCORE",
+        "EXOMISER_VARIANT_SCORE",
+        "CONTRIBUTING_VARIANT",
+        "WHITELIST_VARIANT",
+        "FUNCTIONAL_CLASS",
+        "HGVS",
+        "EXOMISER_ACMG_CLASSIFICATION",
+        "EXOMISER_ACMG_EVIDENCE",
+        "EXOMISER_ACMG_DISEASE_ID",
+        "EXOMISER_ACMG_DISEASE_NAME",
+    ]
+    transcript_modes = ["first", "worst", "canonical"]
+
+    def __init__(self, vcf):
+        """
+        The initializer function:
+            This function creates a number of instance attributes:
+                csq_format = a list of strings with the CSQ field names.
+                exomiser_format = a list of strings with the Exomiser field
+                                  names.
+        """
+        self.csq_format = self.header_fields(
+            vcf, "CSQ", "Format: ", "", self.vep_annotation
+        )
+        self.exomiser_format = self.header_fields(
+            vcf, "Exomiser", "{", "}", self.exomiser_annotation
+        )
+
+    def header_fields(self, vcf, info_id, start, end, default):
+        """
+        The header_fields function:
+            This function reads the description of an INFO header line from a
+            cyvcf2 object and returns the pipe separated field names that are
+            found between the start and end strings. If the header line is
+            missing, the default list is returned.
+        """
+        try:
+            description = vcf.get_header_type(info_id)["Description"]
+        except KeyError:
+            return default
+        description = description.strip('"')
+        if start not in description:
+            return default
+        fields = description.split(start, 1)[1]
+        if end:
+            fields = fields.split(end, 1)[0]
+        return fields.strip().split("|")
+
+    def getter(self, field_format, fields, info_id):
+        """
+        The getter function:
+            This function resolves the indices of the requested fields and
+            returns a function that selects those fields from a list, always
+            as a tuple.
+        """
+        indices = []
+        for field in fields:
+            if field not in field_format:
+                raise ValueError(
+                    f"The {info_id} annotation has no field named {field}."
+                )
+            indices.append(field_format.index(field))
+        if len(indices) == 1:
+            index = indices[0]
+            return lambda values: (values[index],)
+        return itemgetter(*indices)
+
+    def check_canonical(self):
+        """
+        The check_canonical function:
+            This function checks if the CSQ annotation has the CANONICAL field
+            that VEP only adds when it is run with --canonical.
+        """
+        if "CANONICAL" not in self.csq_format:
+            raise ValueError(
+                "The CSQ annotation has no CANONICAL field, run VEP with"
+                " --canonical to use the canonical transcripts."
+            )
+
+    def csq_extractor(self, fields):
+        """
+        The csq_extractor function:
+            This function returns a function that takes the CSQ INFO string of
+            a variant and returns the requested fields of the first transcript
+            as a tuple of strings. Missing annotation results in empty strings.
+        """
+        getter = self.getter(self.csq_format, fields, "CSQ")
+        width = len(self.csq_format)
+        empty = ("",) * len(fields)
+
+        def extract(csq_info):
+            values = csq_info.split(",", 1)[0].split("|")
+            if len(values) < width:
+                return empty
+            return getter(values)
+
+        return extract
+
+    def csq_matrix_extractor(self, fields, transcripts="first"):
+        """
+        The csq_matrix_extractor function:
+            This function returns a function that takes a list of CSQ INFO
+            strings and returns a float matrix with one row per variant and
+            one column per requested field. The transcripts argument decides
+            which CSQ entries are used: the first entry, the per-field maximum
+            over all entries (worst), or the entry that VEP flagged as
+            CANONICAL, falling back to the first entry. For worst and canonical
+            all entries of the batch are parsed into a single matrix, which is
+            reduced per variant with numpy.
+        """
+        if transcripts == "first":
+            extractor = self.csq_extractor(fields)
+
+            def extract_first(csq_infos):
+                return self.to_matrix(
+                    [extractor(csq_info) for csq_info in csq_infos],
+                    len(fields),
+                )
+
+            return extract_first
+        if transcripts == "canonical":
+            self.check_canonical()
+            getter = self.getter(
+                self.csq_format, list(fields) + ["CANONICAL"], "CSQ"
+            )
+        else:
+            getter = self.getter(self.csq_format, fields, "CSQ")
+        width = len(self.csq_format)
+        empty = ("",) * (len(fields) + (transcripts == "canonical"))
+
+        def extract_all(csq_infos):
+            rows = []
+            starts = []
+            for csq_info in csq_infos:
+                starts.append(len(rows))
+                for entry in csq_info.split(","):
+                    values = entry.split("|")
+                    rows.append(
+                        getter(values) if len(values) >= width else empty
+                    )
+            if not rows:
+                return np.empty((0, len(fields)))
+            starts = np.array(starts)
+            if transcripts == "worst":
+                return np.fmax.reduceat(
+                    self.to_matrix(rows, len(fields)), starts, axis=0
+                )
+            canonical = np.array([row[-1] == "YES" for row in rows])
+            entries = np.arange(len(rows))
+            chosen = np.minimum.reduceat(
+                np.where(canonical, entries, len(rows)), starts
+            )
+            chosen = np.where(chosen == len(rows), starts, chosen)
+            return self.to_matrix(
+                [rows[index] for index in chosen.tolist()], len(fields)
+            )
+
+        return extract_all
+
+    def csq_column_extractor(self, fields, transcripts="first"):
+        """
+        The csq_column_extractor function:
+            This function returns a function that takes a list of CSQ INFO
+            strings and returns the requested fields as string columns, one
+            numpy array per field, together with an array of the row at which
+            the entries of each variant start. For first and canonical there
+            is one row per variant, for worst every CSQ entry is a row so the
+            rows of a variant can be reduced with numpy. Missing annotation
+            results in empty strings.
+        """
+        if transcripts == "canonical":
+            self.check_canonical()
+            getter = self.getter(
+                self.csq_format, list(fields) + ["CANONICAL"], "CSQ"
+            )
+        else:
+            getter = self.getter(self.csq_format, fields, "CSQ")
+        width = len(self.csq_format)
+        empty = ("",) * (len(fields) + (transcripts == "canonical"))
+
+        def extract_columns(csq_infos):
+            rows = []
+            starts = []
+            for csq_info in csq_infos:
+                starts.append(len(rows))
+                entries = csq_info.split(",")
+                if transcripts == "first":
+                    entries = entries[:1]
+                variant_rows = []
+                for entry in entries:
+                    values = entry.split("|")
+                    variant_rows.append(
+                        getter(values) if len(values) >= width else empty
+                    )
+                if transcripts == "canonical":
+                    variant_rows = [
+                        next(
+                            (row for row in variant_rows if row[-1] == "YES"),
+                            variant_rows[0],
+                        )
+                    ]
+                rows.extend(variant_rows)
+            if not rows:
+                columns = [np.empty(0, dtype=str) for _ in fields]
+            else:
+                columns = [
+                    np.array(column, dtype=str)
+                    for column in list(zip(*rows))[: len(fields)]
+                ]
+            return columns, np.array(starts, dtype=np.int64)
+
+        return extract_columns
+
+    def to_matrix(self, rows, width):
+        """
+        The to_matrix function:
+            This function converts a list of tuples with annotation strings to
+            a float matrix, using the first width fields of each tuple.
+        """
+        matrix = np.empty((len(rows), width))
+        for index, column in enumerate(list(zip(*rows))[:width]):
+            matrix[:, index] = to_float(column)
+        return matrix
+
+    def exomiser_extractor(self, fields):
+        """
+        The exomiser_extractor function:
+            This function returns a function that takes the Exomiser INFO
+            string of a variant and returns the requested fields of the first
+            set in between curly brackets as a tuple of strings. Missing
+            annotation results in empty strings.
+        """
+        getter = self.getter(self.exomiser_format, fields, "Exomiser")
+        width = len(self.exomiser_format)
+        empty = ("",) * len(fields)
+
+        def extract(exomiser_info):
+            end = exomiser_info.find("}")
+            if not exomiser_info.startswith("{") or end < 0:
+                return empty
+            values = exomiser_info[1:end].split("|")
+            if len(values) < width:
+                return empty
+            return getter(values)
+
+        return extract
+
+
+# Additional information:
+# =======================
+#
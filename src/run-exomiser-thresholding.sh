@@ -44,9 +44,32 @@ run_prepare_exomiser_files() {
         --temp "/mnt/flashblade01/scratch/j.boom/tmp" \
         --config "/mnt/titan/users/j.boom/tools/Exomiser/application.properties" \
         --jar "/mnt/titan/users/j.boom/tools/Exomiser/exomiser-cli-14.0.0/exomiser-cli-14.0.0.jar" \
+        --executor "slurm-array" \
+        --array-throttle 10 \
+        --wait \
         2>&1 | tee /mnt/flashblade01/scratch/j.boom/logs/run_prepare_exomiser_files.log
 }
 
+run_prepare_exomiser_sweep() {
+    # The run_prepare_exomiser_sweep function:
+    #     This function calls the prepare-exomiser-files.py python script in
+    #     sweep mode. Exomiser is run once without priority score filter and
+    #     the tsv files of every minimal priority score are derived from that
+    #     run, so collect-exomiser-files.py is not needed.
+    source /home/j.boom/miniconda3/bin/activate base
+    python3 /home/j.boom/develop/genomescan/src/python/prepare-exomiser-files.py \
+        --yaml "/home/j.boom/develop/genomescan/src/genome.v14.yml" \
+        --vcf "/mnt/flashblade01/scratch/j.boom/data/FR07961000.pathogenic.general.vcf" \
+        --output "/mnt/flashblade01/scratch/j.boom/results" \
+        --log "/mnt/flashblade01/scratch/j.boom/logs" \
+        --hpo "HP:0002858,HP:0500089,HP:0100009,HP:0100010,HP:0033714" \
+        --temp "/mnt/flashblade01/scratch/j.boom/tmp" \
+        --config "/mnt/titan/users/j.boom/tools/Exomiser/application.properties" \
+        --jar "/mnt/titan/users/j.boom/tools/Exomiser/exomiser-cli-14.0.0/exomiser-cli-14.0.0.jar" \
+        --sweep \
+        2>&1 | tee /mnt/flashblade01/scratch/j.boom/logs/run_prepare_exomiser_sweep.log
+}
+
 run_collect_exomiser_files() {
     # The run_collect_exomiser_files function:
     #     This function calls the collect_exomiser_files.py python script.
@@ -133,6 +156,7 @@ main() {
     # The main function:
     #     This function runs all processing function in correct order.
     #run_prepare_exomiser_files
+    #run_prepare_exomiser_sweep
     #run_collect_exomiser_files
     run_analyse_exomiser_files
     #run_validation_set
@@ -70,13 +70,11 @@ run_ranking() {
     INPUT_DIR="/mnt/flashblade01/scratch/j.boom/data/family/results"
     source /home/j.boom/miniconda3/bin/activate base
 
-    for VCF in "${INPUT_DIR}"/*.hard-filtered.sorted.annotated.vep.filtered.exomiser.024.passonly.vcf;
-    do
-        python3 /home/j.boom/develop/genomescan/src/python/rank-variants.py \
-            --phen2gene "/mnt/flashblade01/scratch/j.boom/phen2gene/meningioma.associated_gene_list" \
-            --filtered-vcf "${VCF}" \
-            --output "${VCF::-3}ranking"
-    done
+    python3 /home/j.boom/develop/genomescan/src/python/rank-variants.py \
+        --phen2gene "/mnt/flashblade01/scratch/j.boom/phen2gene/meningioma.associated_gene_list" \
+        --filtered-vcf "${INPUT_DIR}"/*.hard-filtered.sorted.annotated.vep.filtered.exomiser.024.passonly.vcf \
+        --cohort-output "${INPUT_DIR}/family.ranking.tsv" \
+        --cores 4
 }
 
 run_exomiser() {
@@ -136,6 +134,7 @@ run_vep() {
                         --dir_plugins "/mnt/titan/users/j.boom/data/vep/plugins" \
                         --vcf \
                         --cache \
+                        --canonical \
                         --fork 10 \
                         --plugin "CADD,snv=/mnt/titan/users/j.boom/data/vep/plugins_data/whole_genome_SNVs.tsv.gz,indels=/mnt/titan/users/j.boom/data/vep/plugins_data/InDels.tsv.gz" \
                         --plugin "CAPICE,snv=/mnt/titan/users/j.boom/data/vep/plugins_data/capice_v1.0_build37_snvs.tsv.gz,indels=/mnt/titan/users/j.boom/data/vep/plugins_data/capice_v1.0_build37_indels.tsv.gz" \
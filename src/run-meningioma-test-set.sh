@@ -80,9 +80,24 @@ filter_vep() {
         --vcf "${INPUT_VCF::-3}fixed.sorted.annotated.vcf"
 }
 
+filter_vep_stream() {
+    # The filter_vep_stream function:
+    #     This function pipes the output of vep directly into the python script
+    #     that filters on the vep thresholds, so the annotated vcf file is
+    #     never written to disk.
+    source /home/j.boom/miniconda3/bin/activate base
+    run_vep "STDOUT" \
+        | python3 /home/j.boom/develop/genomescan/src/python/filter-vep-vcf.py \
+            --vcf "-" \
+            --output "${INPUT_VCF::-3}fixed.sorted.annotated.vep.filtered.vcf"
+}
+
 run_vep() {
     # The run_vep function:
-    #     This function runs vep on the test dataset.
+    #     This function runs vep on the test dataset. The output file can be
+    #     given as first argument, STDOUT writes the annotated vcf to the
+    #     standard output.
+    local output_file="${1:-${INPUT_VCF::-3}fixed.sorted.annotated.vcf}"
     singularity \
         exec \
             --containall \
@@ -90,7 +105,7 @@ run_vep() {
             docker://ensemblorg/ensembl-vep:release_111.0 \
                 vep \
                     --input_file "${INPUT_VCF::-3}fixed.sorted.vcf" \
-                    --output_file "${INPUT_VCF::-3}fixed.sorted.annotated.vcf" \
+                    --output_file "${output_file}" \
                     --stats_file "${INPUT_VCF::-3}fixed.sorted.annotated.stats.html" \
                     --species "human" \
                     --format "vcf" \
@@ -99,6 +114,7 @@ run_vep() {
                     --dir_plugins "/mnt/titan/users/j.boom/data/vep/plugins" \
                     --vcf \
                     --cache \
+                    --canonical \
                     --fork 10 \
                     --plugin "CADD,snv=/mnt/titan/users/j.boom/data/vep/plugins_data/whole_genome_SNVs.tsv.gz,indels=/mnt/titan/users/j.boom/data/vep/plugins_data/InDels.tsv.gz" \
                     --plugin "CAPICE,snv=/mnt/titan/users/j.boom/data/vep/plugins_data/capice_v1.0_build37_snvs.tsv.gz,indels=/mnt/titan/users/j.boom/data/vep/plugins_data/capice_v1.0_build37_indels.tsv.gz" \
@@ -153,6 +169,7 @@ main() {
     #prepare_vcf_file
     #run_vep
     #filter_vep
+    #filter_vep_stream
     #run_exomiser
     #run_ranking
     run_monte_carlo_simulation
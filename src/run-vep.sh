@@ -247,6 +247,7 @@ run_vep_loop() {
                         --dir_plugins "/mnt/titan/users/j.boom/data/vep/plugins" \
                         --vcf \
                         --cache \
+                        --canonical \
                         --fork 5 \
                         --plugin "AlphaMissense,file=/mnt/titan/users/j.boom/data/vep/plugins_data/AlphaMissense_hg19.tsv.gz" \
                         --plugin "CADD,snv=/mnt/titan/users/j.boom/data/vep/plugins_data/whole_genome_SNVs.tsv.gz,indels=/mnt/titan/users/j.boom/data/vep/plugins_data/InDels.tsv.gz" \
@@ -277,6 +278,7 @@ run_vep(){
                     --dir_plugins "/mnt/titan/users/j.boom/data/vep/plugins" \
                     --vcf \
                     --cache \
+                    --canonical \
                     --fork 5 \
                     --plugin "AlphaMissense,file=/mnt/titan/users/j.boom/data/vep/plugins_data/AlphaMissense_hg19.tsv.gz" \
                     --plugin "CADD,snv=/mnt/titan/users/j.boom/data/vep/plugins_data/whole_genome_SNVs.tsv.gz,indels=/mnt/titan/users/j.boom/data/vep/plugins_data/InDels.tsv.gz" \